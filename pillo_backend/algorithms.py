@@ -0,0 +1,63 @@
+import json
+import os
+
+import config
+import stages  # noqa: F401  註冊所有處理階段
+from pipeline import Pipeline, register_algorithm
+
+register_algorithm(Pipeline("algorithm1", [
+    ("gray", {}),
+    ("blur", {"ksize": 7}),
+    ("threshold", {"thresh": 80, "otsu": True, "invert": True}),
+    ("contours", {"mode": "external", "approx": "simple"}),
+    ("count", {}),
+    ("annotate", {"label": "Otsu"}),
+], description="Otsu 二值化輪廓偵測"))
+
+# 原本的 dilate(iterations=0) 不做任何事，因此不加入 morphology 階段
+register_algorithm(Pipeline("algorithm2", [
+    ("gray", {}),
+    ("blur", {"ksize": 7}),
+    ("canny", {"low": 100, "high": 150, "aperture": 3}),
+    ("contours", {"mode": "external", "approx": "none"}),
+    ("count", {}),
+    ("annotate", {"label": "Canny"}),
+], description="Canny 邊緣偵測輪廓"))
+
+# 與 algorithm1 共用灰階、模糊與 Otsu 二值化，比較時只多算連通元件與拆分
+register_algorithm(Pipeline("algorithm3", [
+    ("gray", {}),
+    ("blur", {"ksize": 7}),
+    ("threshold", {"thresh": 80, "otsu": True, "invert": True}),
+    ("components", {"min_fraction": 2e-4, "max_fraction": 0.2, "min_fill": 0.3}),
+    ("blob_split", {"tolerance": 0.25, "peak_ratio": 0.6}),
+    ("count", {}),
+    ("annotate", {"label": "CC"}),
+], description="連通元件計數，只估計數量（偵測框不是藥丸位置），適用素色背景的藥盤"))
+
+register_algorithm(Pipeline("yolo11", [
+    ("rgb", {}),
+    ("yolo", {}),
+    ("count", {}),
+    ("annotate", {"label": "YOLO"}),
+], description="YOLO 物件偵測"))
+
+
+def load_presets(path):
+    """把 tune.py 產生的參數預設註冊成具名算法，回傳註冊的名稱"""
+    with open(path, encoding="utf-8") as f:
+        presets = json.load(f).get("presets", {})
+    names = []
+    for name, preset in presets.items():
+        register_algorithm(Pipeline(name, [tuple(stage) for stage in preset["stages"]],
+                                    description=preset.get("description", "")))
+        names.append(name)
+    return names
+
+
+if config.PRESETS_PATH:
+    if os.path.exists(config.PRESETS_PATH):
+        loaded = load_presets(config.PRESETS_PATH)
+        print(f"🎛️ 已載入參數預設: {', '.join(loaded) or '（無）'}")
+    else:
+        print(f"⚠️ 找不到參數預設檔: {config.PRESETS_PATH}")
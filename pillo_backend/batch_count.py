@@ -0,0 +1,280 @@
+"""離線批次計數：對資料夾、萬用字元或 zip 壓縮檔中的影像執行算法並寫出結果
+
+    python batch_count.py ../dataset/pillo_dataset ../dataset/*.zip -a algorithm1 -o counts.csv
+    python batch_count.py "photos/**/*.jpg" -a yolo11 -o counts.jsonl --annotate annotated/
+
+影像在行程池中讀取、解碼與偵測，主行程只負責依完成順序寫出 CSV 或 JSONL。
+輸出檔已存在時預設接續執行，跳過已成功的影像；加上 --no-resume 則重新開始。
+也可在 Python 中直接呼叫 count_images()。
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import algorithms  # noqa: F401  註冊內建算法，讓主行程可以先檢查算法名稱
+from pipeline import DEFAULT_ALGORITHM, get_algorithm
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+CSV_FIELDS = ("source", "algorithm", "success", "count", "error", "latency_ms", "decode_ms",
+              "annotated")
+
+# 每個工作者行程各自建立的處理器與已開啟的 zip 檔
+_processor = None
+_archives = {}
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith(".")
+
+
+def iter_sources(inputs):
+    """依序列出所有影像，產生 (名稱, 檔案路徑, zip 成員名稱或 None)
+
+    名稱在重新執行時保持不變，作為接續執行時比對的鍵：一般檔案為路徑，
+    zip 內的影像為 "壓縮檔路徑:成員名稱"。
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if _is_image(name):
+                        path = os.path.join(root, name)
+                        yield path, path, None
+        elif zipfile.is_zipfile(item):
+            with zipfile.ZipFile(item) as archive:
+                members = sorted(m for m in archive.namelist() if _is_image(m))
+            for member in members:
+                yield f"{item}:{member}", item, member
+        else:
+            paths = sorted(glob.glob(item, recursive=True))
+            if not paths:
+                raise FileNotFoundError(f"找不到符合的影像: {item}")
+            for path in paths:
+                if os.path.isfile(path) and _is_image(path):
+                    yield path, path, None
+
+
+def _read(path, member):
+    if member is None:
+        with open(path, "rb") as f:
+            return f.read()
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = zipfile.ZipFile(path)
+    return archive.read(member)
+
+
+def _annotated_path(annotate_dir, name):
+    """把來源名稱轉成 annotate_dir 下的相對路徑，不會跳出該資料夾"""
+    parts = [p for p in name.replace(":", "/").replace("\\", "/").split("/")
+             if p not in ("", ".", "..")]
+    stem, _ = os.path.splitext(os.path.join(annotate_dir, *parts))
+    return stem + ".jpg"
+
+
+def _init_worker():
+    global _processor
+    import cv2
+    from processor import ImageProcessor
+    # 每個行程一次只處理一張影像，不需要動態批次與 OpenCV 內部多執行緒
+    cv2.setNumThreads(1)
+    _processor = ImageProcessor(yolo_max_batch=1)
+
+
+def count_one(name, path, member, algorithm, options=None, annotate_dir=None):
+    """讀取並處理一張影像，回傳一列結果；可在工作者行程或主行程中執行"""
+    if _processor is None:
+        _init_worker()
+    start = time.perf_counter()
+    row = {"source": name, "algorithm": algorithm}
+    try:
+        image_bytes = _read(path, member)
+    except Exception as e:
+        row.update(success=False, count=0, error=f"無法讀取影像: {e}")
+        return row
+
+    output = "image" if annotate_dir else "count"
+    result = _processor.process_bytes(image_bytes, algorithm, "jpeg", output, options)
+    row.update(success=result["success"], count=result["count"],
+               error=result.get("error"))
+    jpeg = result.pop("processed_jpeg", None)
+    if jpeg is not None:
+        target = _annotated_path(annotate_dir, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(jpeg)
+        row["annotated"] = target
+    timings = result.get("timings", {})
+    row["decode_ms"] = timings.get("decode")
+    row["timings"] = timings
+    row["latency_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+    return row
+
+
+def completed_sources(output_path):
+    """讀取既有輸出檔中已成功處理的來源名稱"""
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path, newline="", encoding="utf-8") as f:
+        if output_path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if row.get("success") in (True, "True"):
+                done.add(row["source"])
+    return done
+
+
+class _Writer:
+    """依副檔名寫出 CSV 或 JSONL，每列立即 flush，中斷後可接續"""
+
+    def __init__(self, path):
+        self.path = path
+        self.csv = path.endswith(".csv")
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        if self.csv:
+            self._writer = csv.DictWriter(self._file, CSV_FIELDS, extrasaction="ignore")
+            if new:
+                self._writer.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            self._writer.writerow(row)
+        else:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def iter_counts(inputs, algorithm=DEFAULT_ALGORITHM, options=None, workers=None,
+                annotate_dir=None, skip=(), stats=None):
+    """依完成順序逐列產生結果
+
+    workers 為 0 時在目前行程中依序處理；否則使用行程池，
+    同時送出的工作最多為工作者數的 4 倍，避免一次把所有影像排進佇列。
+    stats 為 dict 時，在 stats["skipped"] 累計實際因 skip 略過的影像數。
+    """
+    stats = {} if stats is None else stats
+    stats.setdefault("skipped", 0)
+
+    def not_skipped():
+        for name, path, member in iter_sources(inputs):
+            if name in skip:
+                stats["skipped"] += 1
+                continue
+            yield name, path, member
+
+    sources = not_skipped()
+    if workers == 0:
+        for source in sources:
+            yield count_one(*source, algorithm, options, annotate_dir)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = set()
+        for source in sources:
+            pending.add(pool.submit(count_one, *source, algorithm, options, annotate_dir))
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def count_images(inputs, output_path="counts.csv", algorithm=DEFAULT_ALGORITHM, options=None,
+                 workers=None, annotate_dir=None, resume=True, progress=True):
+    """批次計數並寫入 output_path（.csv 或 .jsonl），回傳摘要"""
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    get_algorithm(algorithm)
+    if not resume and os.path.exists(output_path):
+        os.remove(output_path)
+    skip = completed_sources(output_path) if resume else set()
+    if skip and progress:
+        print(f"⏭️ 接續執行，{output_path} 中已有 {len(skip)} 張完成的影像", file=sys.stderr)
+
+    writer = _Writer(output_path)
+    processed = errors = total_count = 0
+    stats = {"skipped": 0}
+    start = last_report = time.perf_counter()
+    try:
+        for row in iter_counts(inputs, algorithm, options, workers, annotate_dir, skip,
+                               stats):
+            writer.write(row)
+            processed += 1
+            if row["success"]:
+                total_count += row["count"]
+            else:
+                errors += 1
+            now = time.perf_counter()
+            if progress and now - last_report >= 1.0:
+                last_report = now
+                print(f"📦 已處理 {processed} 張，{processed / (now - start):.1f} 張/秒，"
+                      f"錯誤 {errors}", file=sys.stderr)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "processed": processed,
+        "skipped": stats["skipped"],
+        "errors": errors,
+        "total_count": total_count,
+        "seconds": round(elapsed, 3),
+        "images_per_second": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        "output": output_path,
+    }
+    if progress:
+        print(f"✅ 完成 {processed} 張（跳過 {stats['skipped']}、錯誤 {errors}），"
+              f"{summary['seconds']:.1f}s，{summary['images_per_second']} 張/秒 → {output_path}",
+              file=sys.stderr)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="資料夾、萬用字元（可用 **）或 zip 壓縮檔")
+    parser.add_argument("-a", "--algorithm", default=DEFAULT_ALGORITHM)
+    parser.add_argument("-o", "--output", default="counts.csv", help="輸出檔，.csv 或 .jsonl")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="工作者行程數，預設為 CPU 核心數；0 表示不使用行程池")
+    parser.add_argument("--annotate", metavar="DIR", help="另外把標註後的影像寫到此資料夾")
+    parser.add_argument("--no-resume", action="store_true", help="忽略既有輸出檔，重新開始")
+    parser.add_argument("--model")
+    parser.add_argument("--imgsz", type=int)
+    parser.add_argument("--conf", type=float)
+    parser.add_argument("--iou", type=float)
+    parser.add_argument("--roi", help="只處理 x,y,w,h 區域")
+    parser.add_argument("--max-side", type=int)
+    parser.add_argument("--tiling", choices=("auto", "on", "off"))
+    args = parser.parse_args(argv)
+
+    options = {"model": args.model, "imgsz": args.imgsz, "conf": args.conf, "iou": args.iou,
+               "max_side": args.max_side, "tiling": args.tiling,
+               "roi": [int(v) for v in args.roi.split(",")] if args.roi else None}
+    options = {k: v for k, v in options.items() if v is not None}
+    try:
+        summary = count_images(args.inputs, args.output, args.algorithm, options, args.workers,
+                               args.annotate, resume=not args.no_resume)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
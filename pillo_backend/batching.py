@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatcherClosedError(RuntimeError):
+    """批次執行緒已關閉"""
+
+
+class MicroBatcher:
+    """把多個執行緒同時送來的單張推論合併成一次批次推論
+
+    背景執行緒取得第一張影像後，最多再等待 max_wait_ms 毫秒或湊滿
+    max_batch_size 張，接著呼叫 predict_batch(list) 一次處理，
+    並把結果依序交還給各自等待的呼叫端。
+    """
+
+    def __init__(self, predict_batch, max_batch_size=8, max_wait_ms=5.0, name="pillo-batcher"):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.batches = 0
+        self.frames = 0
+        self.largest_batch = 0
+        self.closed = False
+        self._queue = queue.Queue()
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item, timeout=None):
+        """送出單張影像並等待其結果"""
+        future = Future()
+        with self._submit_lock:
+            if self.closed:
+                raise BatcherClosedError("批次執行緒已關閉")
+            self._queue.put((item, future))
+        return future.result(timeout)
+
+    def close(self):
+        """停止接收新影像，已排隊的影像仍會處理完"""
+        with self._submit_lock:
+            if not self.closed:
+                self.closed = True
+                self._queue.put(None)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 \
+                    else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # 關閉訊號放回佇列，處理完這一批再結束
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            items = [item for item, _ in batch]
+            try:
+                results = self.predict_batch(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+            self.frames += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "frames": self.frames,
+            "average_batch_size": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
@@ -0,0 +1,199 @@
+"""準確度與延遲基準：對標註資料集執行所有已註冊的算法
+
+    python benchmarks/bench_accuracy.py -o bench.json
+    python benchmarks/bench_accuracy.py -a algorithm1 algorithm2 --baseline bench.json
+
+資料集為 YOLO 格式（images/*.jpg 與 labels/*.txt，座標為正規化的中心點與寬高）。
+每個算法先以 geometry 輸出計算數量誤差與偵測框的 precision / recall
+（輪廓以外接矩形比對），再以 image 輸出重複執行 --repeat 次，
+統計各階段耗時的 p50 / p95 / p99。結果寫成 JSON；指定 --baseline 時與
+上一次的結果比較，數量誤差或延遲退步超過門檻時以結束碼 1 結束。
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from labels import (DEFAULT_DATASET, image_size, load_dataset, match_boxes,  # noqa: E402
+                    precision_recall, to_pixels)
+from metrics import stage_group  # noqa: E402
+from pipeline import ALGORITHMS  # noqa: E402
+from processor import ImageProcessor  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+def predicted_boxes(result):
+    if "boxes" in result:
+        return np.array([b[:4] for b in result["boxes"]], np.float32).reshape(-1, 4)
+    rects = [cv2.boundingRect(np.array(c, np.int32).reshape(-1, 2)) for c in result["contours"]]
+    rects = np.array(rects, np.float32).reshape(-1, 4)
+    rects[:, 2:] += rects[:, :2]
+    return rects
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    stats = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    stats["mean"] = round(float(np.mean(values)), 3)
+    return stats
+
+
+def evaluate(processor, name, samples, repeat, iou_threshold):
+    counts = []
+    tp = fp = fn = 0
+    stages, groups, totals = {}, {}, []
+    errors = []
+
+    for path, truth in samples:
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        result = processor.process_bytes(image_bytes, name, output="geometry")
+        if not result["success"]:
+            errors.append(f"{os.path.basename(path)}: {result['error']}")
+            continue
+        if truth is not None:
+            gt = to_pixels(truth, *image_size(image_bytes))
+            counts.append((result["count"], len(gt)))
+            t, p, n = match_boxes(predicted_boxes(result), gt, iou_threshold)
+            tp, fp, fn = tp + t, fp + p, fn + n
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            timed = processor.process_bytes(image_bytes, name, output="image")
+            totals.append((time.perf_counter() - start) * 1000.0)
+            by_group = {}
+            for stage, ms in timed.get("timings", {}).items():
+                stages.setdefault(stage, []).append(ms)
+                group = stage_group(stage)
+                by_group[group] = by_group.get(group, 0.0) + ms
+            for group, ms in by_group.items():
+                groups.setdefault(group, []).append(ms)
+
+    report = {"images": len(samples), "errors": errors}
+    if counts:
+        pred, gt = np.array(counts, np.float64).T
+        diff = pred - gt
+        report["count"] = {
+            "mae": round(float(np.abs(diff).mean()), 3),
+            "mean_error": round(float(diff.mean()), 3),
+            "mape": round(float((np.abs(diff) / np.maximum(gt, 1)).mean()), 4),
+            "exact": round(float((diff == 0).mean()), 4),
+            "predicted": pred.astype(int).tolist(),
+            "ground_truth": gt.astype(int).tolist(),
+        }
+        precision, recall, f1 = precision_recall(tp, fp, fn)
+        report["boxes"] = {
+            "iou": iou_threshold,
+            "tp": tp, "fp": fp, "fn": fn,
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": round(f1, 4),
+        }
+    report["latency_ms"] = {
+        "total": percentiles(totals),
+        "groups": {group: percentiles(v) for group, v in groups.items()},
+        "stages": {stage: percentiles(v) for stage, v in stages.items()},
+    }
+    return report
+
+
+def compare(current, baseline, max_latency_regression, max_error_regression):
+    """與基準結果比較，回傳退步項目的說明清單"""
+    regressions = []
+    for name, report in current["algorithms"].items():
+        before = baseline.get("algorithms", {}).get(name)
+        if before is None or "latency_ms" not in report:
+            continue
+        old = before.get("latency_ms", {}).get("total", {}).get("p50")
+        new = report["latency_ms"]["total"].get("p50")
+        if old and new and new > old * (1 + max_latency_regression):
+            regressions.append(f"{name}: p50 延遲 {old:.1f}ms -> {new:.1f}ms")
+        old = before.get("count", {}).get("mae")
+        new = report.get("count", {}).get("mae")
+        if old is not None and new is not None and new > old + max_error_regression:
+            regressions.append(f"{name}: 數量平均誤差 {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'algorithm':>12} {'MAE':>8} {'prec':>6} {'recall':>6} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, report in results["algorithms"].items():
+        total = report.get("latency_ms", {}).get("total")
+        if not total and (report.get("error") or report.get("errors")):
+            print(f"{name:>12} {report.get('error') or report['errors'][0]}")
+            continue
+        # 沒有延遲樣本（例如 --repeat 0）時延遲欄位顯示 nan
+        total = total or {}
+        count = report.get("count", {})
+        boxes = report.get("boxes", {})
+        print(f"{name:>12} {count.get('mae', float('nan')):>8.2f} "
+              f"{boxes.get('precision', float('nan')):>6.3f} "
+              f"{boxes.get('recall', float('nan')):>6.3f} "
+              f"{total.get('p50', float('nan')):>9.2f} {total.get('p95', float('nan')):>9.2f} "
+              f"{total.get('p99', float('nan')):>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", nargs="+", default=[DEFAULT_DATASET],
+                        help="YOLO 格式資料集資料夾（含 images/ 與 labels/）")
+    parser.add_argument("-a", "--algorithms", nargs="+", default=None,
+                        help="要測試的算法，預設為所有已註冊的算法")
+    parser.add_argument("--repeat", type=int, default=5, help="每張影像量測延遲的次數")
+    parser.add_argument("--iou", type=float, default=0.5, help="偵測框配對的 IoU 門檻")
+    parser.add_argument("-o", "--output", help="把結果寫成 JSON")
+    parser.add_argument("--baseline", help="與先前輸出的 JSON 比較")
+    parser.add_argument("--max-latency-regression", type=float, default=0.2,
+                        help="p50 延遲可接受的退步比例")
+    parser.add_argument("--max-error-regression", type=float, default=0.5,
+                        help="數量平均誤差可接受的增加量")
+    args = parser.parse_args()
+
+    samples = [s for root in args.dataset for s in load_dataset(root)]
+    if not samples:
+        parser.error(f"資料集中沒有影像: {', '.join(args.dataset)}")
+    processor = ImageProcessor()
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "datasets": [os.path.normpath(root) for root in args.dataset],
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "algorithms": {},
+    }
+    for name in args.algorithms or list(ALGORITHMS):
+        try:
+            results["algorithms"][name] = evaluate(processor, name, samples, args.repeat,
+                                                   args.iou)
+        except Exception as e:
+            results["algorithms"][name] = {"error": str(e)}
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_latency_regression,
+                              args.max_error_regression)
+        for line in regressions:
+            print(f"⚠️ {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""記憶體基準：持續負載下的常駐記憶體（RSS）與每張影格的陣列配置量
+
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --frames 3000 --threads 4 -a algorithm2 -o memory.json
+
+以合成的藥盤影格模擬多個攝影機會話（--sizes 為各會話的解析度），分別在
+停用與啟用緩衝池（PILLO_BUFFER_POOL_MB），且不設定與設定 Docker 映像中
+glibc 的 MALLOC_TRIM_THRESHOLD_ / MALLOC_MMAP_THRESHOLD_ 時，各以獨立的
+行程量測：
+
+1. 單一執行緒處理 --sample 張影格，以 tracemalloc 量測每張影格處理期間
+   陣列配置的峰值（NumPy 陣列與 OpenCV 的輸出都會被追蹤）
+2. --threads 個執行緒持續處理 --frames 張影格，每 --interval 張取樣一次 RSS，
+   並統計每張影格的 minor page fault 次數（配置大型陣列時的分頁成本）
+
+暖機（前 --warmup 比例的影格）之後，任一啟用緩衝池的設定 RSS 增加量
+超過 --max-growth MB 時以結束碼 1 結束。
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 與 Dockerfile 相同的 glibc 配置器設定，只在行程啟動時讀取
+MALLOC_ENV = {"MALLOC_TRIM_THRESHOLD_": "134217728", "MALLOC_MMAP_THRESHOLD_": "67108864"}
+
+
+def synthetic_frame(width, height, seed=0):
+    """淺色背景上散佈深色藥丸的 JPEG，部分藥丸互相接觸"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 190, np.uint8)
+    radius = max(8, min(width, height) // 40)
+    for _ in range(40):
+        x, y = rng.integers(radius, width - radius), rng.integers(radius, height - radius)
+        cv2.circle(image, (int(x), int(y)), radius, (70, 60, 60), -1)
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        # 沒有 /proc 時退回最大常駐記憶體（macOS 以位元組、Linux 以 KB 為單位）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def minor_faults():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+
+
+def allocation_profile(processor, jobs, sample, mode):
+    """單一執行緒逐張處理，回傳每張影格陣列配置峰值（KB）的統計"""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for image_bytes, algorithm in itertools.islice(itertools.cycle(jobs), sample):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            processor.process_bytes(image_bytes, algorithm, "jpeg", mode)
+            peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+    finally:
+        tracemalloc.stop()
+    # 前半為暖機，緩衝池還在建立
+    steady = peaks[len(peaks) // 2:]
+    return {"mean_kb": round(statistics.mean(steady), 1),
+            "max_kb": round(max(steady), 1)}
+
+
+def sustained_load(processor, jobs, frames, threads, interval, mode):
+    """多個執行緒持續處理，回傳 RSS 取樣、每張影格的 page fault 數與吞吐量"""
+    feed = itertools.islice(itertools.cycle(jobs), frames)
+    lock = threading.Lock()
+    done = [0]
+    samples = [(0, round(rss_mb(), 1))]
+
+    def worker():
+        while True:
+            with lock:
+                job = next(feed, None)
+            if job is None:
+                return
+            result = processor.process_bytes(job[0], job[1], "jpeg", mode)
+            if not result["success"]:
+                raise RuntimeError(result["error"])
+            with lock:
+                done[0] += 1
+                if done[0] % interval == 0:
+                    samples.append((done[0], round(rss_mb(), 1)))
+
+    faults = minor_faults()
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return samples, (minor_faults() - faults) / frames, frames / elapsed
+
+
+def run_config(pool_mb, args):
+    """在獨立行程中執行一種設定，避免兩種設定的 RSS 互相影響"""
+    cv2.setNumThreads(1)
+    from processor import ImageProcessor
+
+    processor = ImageProcessor(buffer_pool_mb=pool_mb)
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes]
+    jobs = [(synthetic_frame(w, h, seed), algorithm)
+            for seed, (w, h) in enumerate(sizes) for algorithm in args.algorithms]
+
+    allocation = allocation_profile(processor, jobs, args.sample, args.mode)
+    samples, faults, fps = sustained_load(processor, jobs, args.frames, args.threads,
+                                          args.interval, args.mode)
+    warm = [rss for frame, rss in samples if frame >= args.frames * args.warmup]
+    return {
+        "pool_mb": pool_mb,
+        "allocation": allocation,
+        "minor_faults_per_frame": round(faults, 1),
+        "fps": round(fps, 1),
+        "rss_mb": {"start": samples[0][1], "warm": warm[0], "end": samples[-1][1],
+                   "max": max(rss for _, rss in samples)},
+        "rss_growth_mb": round(samples[-1][1] - warm[0], 1),
+        "rss_samples": samples,
+        "buffers": processor.buffers.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-a", "--algorithms", nargs="+",
+                        default=["algorithm1", "algorithm2", "algorithm3"])
+    parser.add_argument("--sizes", nargs="+", default=["1280x720", "1920x1080", "640x480"],
+                        help="模擬的各攝影機會話解析度（寬x高）")
+    parser.add_argument("--mode", default="image", choices=("count", "geometry", "image"),
+                        help="處理器的輸出模式")
+    parser.add_argument("--frames", type=int, default=1500, help="持續負載的影格數")
+    parser.add_argument("--threads", type=int, default=4, help="同時處理的執行緒數")
+    parser.add_argument("--sample", type=int, default=60, help="量測配置量的影格數")
+    parser.add_argument("--interval", type=int, default=50, help="每幾張影格取樣一次 RSS")
+    parser.add_argument("--warmup", type=float, default=0.2, help="暖機影格的比例")
+    parser.add_argument("--pool-mb", type=float, default=128.0, help="啟用時的緩衝池上限")
+    parser.add_argument("--max-growth", type=float, default=16.0,
+                        help="啟用緩衝池時暖機後 RSS 可接受的增加量（MB）")
+    parser.add_argument("-o", "--output", help="把結果寫成 JSON")
+    args = parser.parse_args()
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    saved = {key: os.environ.get(key) for key in MALLOC_ENV}
+    for malloc in ("default", "tuned"):
+        # spawn 的子行程以目前的環境變數啟動，glibc 在啟動時讀取設定
+        for key, value in MALLOC_ENV.items():
+            if malloc == "tuned":
+                os.environ[key] = value
+            else:
+                os.environ.pop(key, None)
+        for pool_label, pool_mb in (("off", 0.0), ("on", args.pool_mb)):
+            with ctx.Pool(1) as pool:
+                results[f"{malloc}/{pool_label}"] = pool.apply(run_config, (pool_mb, args))
+    for key, value in saved.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+
+    print(f"{'malloc/pool':>12} {'alloc KB/frame':>15} {'faults/frame':>13} {'fps':>7} "
+          f"{'RSS warm':>9} {'RSS end':>8} {'growth':>7}")
+    for label, r in results.items():
+        print(f"{label:>12} {r['allocation']['mean_kb']:>15.1f} "
+              f"{r['minor_faults_per_frame']:>13.1f} {r['fps']:>7.1f} "
+              f"{r['rss_mb']['warm']:>9.1f} {r['rss_mb']['end']:>8.1f} "
+              f"{r['rss_growth_mb']:>7.1f}")
+    buffers = results["tuned/on"]["buffers"]
+    print(f"\n♻️ 緩衝池命中率 {buffers['hit_rate']:.1%}，閒置 {buffers['idle_bytes'] / 2 ** 20:.1f} MB，"
+          f"{buffers['shapes']} 種形狀")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "settings": vars(args), "results": results},
+                      f, ensure_ascii=False, indent=2)
+    growth = max(r["rss_growth_mb"] for label, r in results.items() if label.endswith("/on"))
+    if growth > args.max_growth:
+        print(f"⚠️ 暖機後 RSS 增加 {growth:.1f} MB，超過 {args.max_growth:.1f} MB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
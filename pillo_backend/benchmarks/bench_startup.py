@@ -0,0 +1,166 @@
+"""冷啟動基準：各模組的匯入耗時與服務就緒時間
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 5 --budget 3 -o startup.json
+
+1. 以 python -X importtime 匯入 main，列出累計耗時最高的模組與各頂層套件的耗時
+2. 確認匯入 main 不會連帶匯入 ultralytics、torch、netifaces
+3. 重複啟動 uvicorn，量測到 /api/status 可回應、以及第一個 algorithm1
+   請求完成的時間
+
+第一個 algorithm1 請求完成時間的中位數超過 --budget 秒，或匯入了不該
+在啟動時匯入的模組時，以結束碼 1 結束。
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 只有 YOLO 或網路介面列舉才需要，啟動時不應匯入
+DEFERRED_MODULES = ("ultralytics", "torch", "netifaces")
+
+
+def import_report(limit):
+    """回傳 (累計耗時最高的模組, 各頂層套件自身耗時總和)，單位為毫秒"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                          cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    modules = []
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        modules.append((int(cumulative_us) / 1000.0, int(self_us) / 1000.0, name))
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000.0
+    modules.sort(reverse=True)
+    top_packages = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return modules[:limit], top_packages[:limit]
+
+
+def deferred_imports():
+    """匯入 main 之後已經載入的延後模組"""
+    code = ("import json, sys, main; "
+            f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR,
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _request(url, data=None, timeout=5.0):
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "image/jpeg"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _sample_jpeg():
+    """640x480 的合成藥盤影像，不依賴資料集"""
+    image = np.full((480, 640, 3), 40, np.uint8)
+    for i in range(12):
+        cv2.circle(image, (60 + (i % 6) * 100, 140 + (i // 6) * 200), 30, (230, 230, 230), -1)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+def cold_start(image_bytes, timeout):
+    """啟動一次服務，回傳 (就緒秒數, 第一個 algorithm1 請求完成秒數)"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while ready is None:
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"服務 {timeout:.0f} 秒內沒有回應")
+            if proc.poll() is not None:
+                raise RuntimeError(f"服務啟動失敗（結束碼 {proc.returncode}）")
+            try:
+                _request(f"{base}/api/status", timeout=1.0)
+                ready = time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.01)
+        result = _request(f"{base}/api/process-image/raw?algorithm=algorithm1&output=count",
+                          data=image_bytes, timeout=timeout)
+        if not result.get("success"):
+            raise RuntimeError(f"algorithm1 請求失敗: {result.get('error')}")
+        return ready, time.perf_counter() - start
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="冷啟動量測次數")
+    parser.add_argument("--budget", type=float, default=3.0,
+                        help="第一個 algorithm1 請求完成時間（中位數）的上限秒數")
+    parser.add_argument("--top", type=int, default=15, help="列出最慢的幾個模組")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("-o", "--output", help="把結果寫成 JSON")
+    args = parser.parse_args()
+
+    modules, packages = import_report(args.top)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative, own, name in modules:
+        print(f"{cumulative:>14.1f} {own:>9.1f}  {name}")
+    print(f"\n{'self ms':>9}  package")
+    for package, own in packages:
+        print(f"{own:>9.1f}  {package}")
+
+    loaded = deferred_imports()
+    image_bytes = _sample_jpeg()
+    runs = [cold_start(image_bytes, args.timeout) for _ in range(args.runs)]
+    ready = statistics.median(r for r, _ in runs)
+    first = statistics.median(f for _, f in runs)
+    print(f"\n⏱️ 就緒 {ready:.2f}s，第一個 algorithm1 結果 {first:.2f}s"
+          f"（{args.runs} 次中位數，預算 {args.budget:.2f}s）")
+
+    failures = []
+    if loaded:
+        failures.append(f"啟動時匯入了應延後的模組: {', '.join(loaded)}")
+    if first > args.budget:
+        failures.append(f"冷啟動 {first:.2f}s 超過預算 {args.budget:.2f}s")
+    for line in failures:
+        print(f"⚠️ {line}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "budget_seconds": args.budget,
+                "ready_seconds": [round(r, 3) for r, _ in runs],
+                "first_result_seconds": [round(f, 3) for _, f in runs],
+                "deferred_modules_loaded": loaded,
+                "slowest_modules": [{"module": n, "cumulative_ms": round(c, 1),
+                                     "self_ms": round(s, 1)} for c, s, n in modules],
+                "packages": [{"package": p, "self_ms": round(s, 1)} for p, s in packages],
+            }, f, ensure_ascii=False, indent=2)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
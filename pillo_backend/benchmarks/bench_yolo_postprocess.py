@@ -0,0 +1,118 @@
+"""YOLO 後處理微基準：逐框轉換 vs 整批向量化，並分開計時繪製
+
+    python benchmarks/bench_yolo_postprocess.py --counts 0 10 50 100 500
+
+有安裝 torch 時以 torch 張量模擬 ultralytics Boxes，否則以 NumPy 陣列代替
+（此時逐框版本少了張量轉換的成本，差距會比實際小）。
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stages import draw_detections, yolo_detections  # noqa: E402
+
+try:
+    import torch
+except Exception:
+    torch = None
+
+
+class _Array:
+    """提供 .cpu().numpy() 介面的 NumPy 包裝"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __getitem__(self, index):
+        return _Array(self.data[index])
+
+    def __len__(self):
+        return len(self.data)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.data
+
+
+def _tensor(data):
+    return torch.from_numpy(data) if torch is not None else _Array(data)
+
+
+class FakeBoxes:
+    """模擬 ultralytics Boxes：支援整批欄位存取與逐框迭代"""
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = _tensor(xyxy)
+        self.conf = _tensor(conf)
+        self.cls = _tensor(cls)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield FakeBoxes(self.xyxy.numpy()[i:i+1], self.conf.numpy()[i:i+1],
+                            self.cls.numpy()[i:i+1])
+
+
+def make_boxes(n, width, height, rng):
+    x1 = rng.uniform(0, width - 60, n)
+    y1 = rng.uniform(0, height - 60, n)
+    size = rng.uniform(20, 60, (n, 2))
+    xyxy = np.stack([x1, y1, x1 + size[:, 0], y1 + size[:, 1]], axis=1).astype(np.float32)
+    conf = rng.uniform(0.25, 1.0, n).astype(np.float32)
+    cls = np.zeros(n, np.float32)
+    return FakeBoxes(xyxy, conf, cls)
+
+
+def legacy_postprocess(boxes):
+    """原本的逐框寫法（不含繪製）"""
+    detections = []
+    for box in boxes:
+        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
+        conf = float(box.conf[0].cpu().numpy())
+        cls_id = int(box.cls[0].cpu().numpy())
+        detections.append((x1, y1, x2, y2, conf, cls_id))
+    return detections
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[0, 10, 50, 100, 200, 500])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--size", type=int, nargs=2, default=[1920, 1080], metavar=("W", "H"))
+    args = parser.parse_args()
+
+    width, height = args.size
+    rng = np.random.default_rng(0)
+    frame = np.zeros((height, width, 3), np.uint8)
+    print(f"backend: {'torch' if torch is not None else 'numpy'}, frame {width}x{height}, "
+          f"repeat {args.repeat}")
+    print(f"{'detections':>10} {'per-box ms':>11} {'vector ms':>10} {'speedup':>8} {'draw ms':>8}")
+    for n in args.counts:
+        boxes = make_boxes(n, width, height, rng)
+        legacy = timeit(lambda: legacy_postprocess(boxes), args.repeat)
+        vector = timeit(lambda: yolo_detections(boxes), args.repeat)
+        detections = yolo_detections(boxes)
+        draw = timeit(lambda: draw_detections(frame, detections), max(1, args.repeat // 10))
+        speedup = legacy / vector if vector > 0 else float("inf")
+        print(f"{n:>10} {legacy:>11.3f} {vector:>10.3f} {speedup:>7.1f}x {draw:>8.3f}")
+
+
+if __name__ == "__main__":
+    cv2.setNumThreads(1)
+    main()
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class BufferPool:
+    """依 (形狀, dtype) 重複使用的中間結果陣列
+
+    每張影格處理期間以 lease() 借出一組陣列，各處理階段把 OpenCV 的輸出
+    直接寫入借到的陣列（dst=），影格處理完畢後整組歸還。同一個攝影機會話
+    的影格尺寸固定，穩定後每張影格的灰階、模糊、二值化等中間結果都不必
+    重新配置記憶體。閒置陣列的總位元組數超過 max_bytes 時，淘汰最久沒有
+    用到的形狀；max_bytes 為 0 時停用，由 OpenCV 自行配置。
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._free = OrderedDict()
+        self._idle_bytes = 0
+        self._leased = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def lease(self):
+        return FrameBuffers(self)
+
+    def take(self, shape, dtype=np.uint8):
+        """取出一個閒置陣列，沒有時新配置；停用時回傳 None"""
+        if not self.enabled:
+            return None
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            arrays = self._free.get(key)
+            if arrays:
+                array = arrays.pop()
+                self._idle_bytes -= array.nbytes
+                self._free.move_to_end(key)
+                self.hits += 1
+            else:
+                array = None
+                self.misses += 1
+        if array is None:
+            array = np.empty(shape, dtype)
+        with self._lock:
+            self._leased += array.nbytes
+        return array
+
+    def give(self, arrays):
+        """歸還陣列；閒置總量超過上限時從最久沒用到的形狀開始淘汰"""
+        with self._lock:
+            for array in arrays:
+                self._leased -= array.nbytes
+                key = (array.shape, array.dtype.str)
+                self._free.setdefault(key, []).append(array)
+                self._free.move_to_end(key)
+                self._idle_bytes += array.nbytes
+            while self._idle_bytes > self.max_bytes and self._free:
+                _, evicted = self._free.popitem(last=False)
+                self._idle_bytes -= sum(array.nbytes for array in evicted)
+                self.evictions += len(evicted)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "shapes": len(self._free),
+                "idle_bytes": self._idle_bytes,
+                "leased_bytes": self._leased,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class FrameBuffers:
+    """單張影格借出的陣列，離開 with 區塊時全部歸還
+
+    借出的陣列只能在處理期間使用，回傳給呼叫端的結果不可引用它們。
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._taken = []
+        self._lock = threading.Lock()
+
+    def get(self, shape, dtype=np.uint8):
+        array = self.pool.take(shape, dtype)
+        if array is not None:
+            # compare 模式下多個算法在不同執行緒中共用同一組
+            with self._lock:
+                self._taken.append(array)
+        return array
+
+    def release(self):
+        with self._lock:
+            taken, self._taken = self._taken, []
+        if taken:
+            self.pool.give(taken)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def _result_size(result):
+    """估算結果佔用的位元組數，只計算影像與幾何資料這類大型欄位"""
+    size = 256
+    for key in ("processed_jpeg", "processed_image"):
+        if key in result:
+            size += len(result[key])
+    for key in ("contours", "boxes"):
+        for item in result.get(key, ()):
+            size += 8 * len(item) + 64
+    return size
+
+
+class ResultCache:
+    """以影像內容雜湊為鍵的處理結果快取
+
+    鍵由解碼後影像位元組的 BLAKE2b 雜湊，加上算法、輸出模式與參數組成，
+    因此同一張影像不論經由哪個端點、由哪個用戶端送來都能命中。
+    條目數、總位元組數與存活時間（TTL）任一超出上限時，依 LRU 淘汰。
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(image_bytes, algorithm, image_format, output, options=None):
+        digest = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+        params = json.dumps(options or {}, sort_keys=True)
+        return (digest, algorithm, image_format, output, params)
+
+    def get(self, key):
+        """命中時回傳結果的淺層複本，呼叫端修改不影響快取內容"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, result = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(result)
+
+    def put(self, key, result):
+        if not self.enabled:
+            return
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, dict(result))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,293 @@
+"""伺服器端攝影機擷取服務
+
+每台攝影機有兩個背景執行緒：
+- 擷取執行緒持續讀取 cv2.VideoCapture，只保留最新的一張影格，讀取延遲
+  不會累加到偵測上；本機影片檔依原始 FPS 播放並循環，可在沒有攝影機的
+  環境中代替攝影機。
+- 偵測執行緒依自己的頻率（detect_fps）取最新影格執行算法與標註，每張
+  結果只編碼一次 JPEG，再分送給所有 MJPEG / WebSocket 觀看者。
+
+觀看者跟不上時只會拿到最新的一張，不會累積延遲。
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+
+import metrics
+from pipeline import DEFAULT_ALGORITHM, get_algorithm
+
+# 擷取失敗（攝影機斷線、串流中斷）後重新開啟前等待的秒數
+RECONNECT_DELAY = 2.0
+# 影片檔沒有記錄 FPS 時的播放速度
+DEFAULT_FILE_FPS = 30.0
+
+
+def parse_camera_specs(text):
+    """解析 "tray=0,demo=videos/tray.mp4" 格式：數字為裝置編號，其他為影片檔或串流網址"""
+    specs = OrderedDict()
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, source = item.partition("=")
+        if not sep or not name.strip() or not source.strip():
+            raise ValueError(f"無效的攝影機設定: {item}")
+        source = source.strip()
+        specs[name.strip()] = int(source) if source.isdigit() else source
+    return specs
+
+
+class FrameGrabber:
+    """背景執行緒持續讀取影像來源，只保留最新的一張影格"""
+
+    def __init__(self, source, name="camera"):
+        self.source = source
+        self.name = name
+        # 本機檔案依原始 FPS 播放並循環；裝置與串流以來源本身的速度讀取
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.frames = 0
+        self.failures = 0
+        self.fps = 0.0
+        self._frame = None
+        self._seq = 0
+        self._timestamp = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"pillo-grab-{self.name}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def latest(self):
+        """回傳 (序號, 影格, 擷取時間)；還沒有影格時影格為 None"""
+        with self._cond:
+            return self._seq, self._frame, self._timestamp
+
+    def wait(self, after_seq, timeout=None):
+        """等待比 after_seq 新的影格，逾時或停止時回傳目前最新的一張"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self._stop.is_set(), timeout)
+            return self._seq, self._frame, self._timestamp
+
+    def _publish(self, frame):
+        now = time.time()
+        with self._cond:
+            if self._timestamp is not None:
+                # 以指數移動平均估計實際擷取速度
+                interval = max(now - self._timestamp, 1e-6)
+                self.fps = 1.0 / interval if not self.fps else 0.9 * self.fps + 0.1 / interval
+            self._frame = frame
+            self._seq += 1
+            self._timestamp = now
+            self.frames += 1
+            self._cond.notify_all()
+
+    def _open(self):
+        capture = cv2.VideoCapture(self.source)
+        if capture.isOpened() and not self.is_file:
+            # 裝置端只緩衝一張，讀到的永遠是最新畫面
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return capture
+
+    def _loop(self):
+        while not self._stop.is_set():
+            capture = self._open()
+            if not capture.isOpened():
+                capture.release()
+                self.failures += 1
+                if self.failures == 1:
+                    print(f"⚠️ 無法開啟攝影機 {self.name}（{self.source}），稍後重試")
+                self._stop.wait(RECONNECT_DELAY)
+                continue
+
+            period = 0.0
+            if self.is_file:
+                fps = capture.get(cv2.CAP_PROP_FPS)
+                period = 1.0 / (fps if fps and fps > 0 else DEFAULT_FILE_FPS)
+            read = 0
+            next_time = time.monotonic()
+            while not self._stop.is_set():
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                read += 1
+                self._publish(frame)
+                if period:
+                    next_time += period
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    else:
+                        # 落後時不追趕，從現在重新計時
+                        next_time = time.monotonic()
+            capture.release()
+
+            if self.is_file and read:
+                # 影片播完，從頭循環
+                continue
+            self.failures += 1
+            print(f"⚠️ 攝影機 {self.name} 讀取中斷，{RECONNECT_DELAY:.0f} 秒後重新連線")
+            self._stop.wait(RECONNECT_DELAY)
+
+
+class FrameBroadcast:
+    """把同一份 JPEG 與結果分送給任意數量的 asyncio 觀看者
+
+    publish 由偵測執行緒呼叫，只喚醒各觀看者；觀看者醒來時讀取最新的一份，
+    來不及送出的舊影格直接略過。
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.jpeg = None
+        self.result = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def viewers(self):
+        return len(self._subscribers)
+
+    def publish(self, jpeg, result):
+        with self._lock:
+            self.seq += 1
+            if jpeg is not None:
+                self.jpeg = jpeg
+            self.result = result
+            subscribers = list(self._subscribers)
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 觀看者所在的事件迴圈已關閉
+                pass
+
+    def latest(self):
+        with self._lock:
+            return self.seq, self.jpeg, self.result
+
+    async def frames(self):
+        """依序產生 (序號, JPEG, 結果)，直到呼叫端停止迭代"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self.jpeg is not None:
+                subscriber[1].set()
+        last = 0
+        try:
+            while True:
+                await subscriber[1].wait()
+                subscriber[1].clear()
+                seq, jpeg, result = self.latest()
+                if seq != last and jpeg is not None:
+                    last = seq
+                    yield seq, jpeg, result
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+class CameraService:
+    """單一攝影機：擷取執行緒、依固定頻率偵測的執行緒與結果分送"""
+
+    def __init__(self, name, source, processor, algorithm=None, detect_fps=5.0, options=None):
+        self.name = name
+        self.source = source
+        self.processor = processor
+        self.algorithm = algorithm or DEFAULT_ALGORITHM
+        self.detect_fps = detect_fps
+        self.options = options or {}
+        self.grabber = FrameGrabber(source, name)
+        self.broadcast = FrameBroadcast()
+        self.processed = 0
+        self.errors = 0
+        self.last_error = None
+        self.detect_ms = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        get_algorithm(self.algorithm)
+
+    def start(self):
+        self._stop.clear()
+        self.grabber.start()
+        self._thread = threading.Thread(target=self._detect_loop, name=f"pillo-detect-{self.name}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.grabber.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def configure(self, algorithm=None, detect_fps=None, options=None):
+        """變更算法、偵測頻率或參數，下一張影格起生效"""
+        if algorithm is not None:
+            get_algorithm(algorithm)
+            self.algorithm = algorithm
+        if detect_fps is not None:
+            if not 0.1 <= detect_fps <= 60:
+                raise ValueError(f"detect_fps 必須介於 0.1 與 60 之間: {detect_fps}")
+            self.detect_fps = detect_fps
+        if options is not None:
+            self.options = options
+
+    def _detect_loop(self):
+        seq = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            new_seq, frame, captured_at = self.grabber.wait(seq, timeout=1.0)
+            if frame is None or new_seq == seq:
+                continue
+            seq = new_seq
+
+            algorithm = self.algorithm
+            # 標註直接畫在這張影格上；擷取執行緒下一次會換成新的陣列
+            result = self.processor.process_array(frame, algorithm, "jpeg", "image",
+                                                  self.options)
+            jpeg = result.pop("processed_jpeg", None)
+            self.detect_ms = (time.monotonic() - started) * 1000.0
+            if result["success"]:
+                self.processed += 1
+                metrics.record_timings(algorithm, result.get("timings", {}))
+            else:
+                self.errors += 1
+                self.last_error = result.get("error")
+            result.setdefault("algorithm", algorithm)
+            result.update(camera=self.name, frame=seq, captured_at=captured_at)
+            self.broadcast.publish(jpeg, result)
+
+            self._stop.wait(max(0.0, 1.0 / self.detect_fps - (time.monotonic() - started)))
+
+    def stats(self):
+        _, _, result = self.broadcast.latest()
+        return {
+            "name": self.name,
+            "source": str(self.source),
+            "algorithm": self.algorithm,
+            "detect_fps": self.detect_fps,
+            "options": self.options,
+            "grabbed": self.grabber.frames,
+            "grab_fps": round(self.grabber.fps, 2),
+            "grab_failures": self.grabber.failures,
+            "processed": self.processed,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "detect_ms": round(self.detect_ms, 3),
+            "viewers": self.broadcast.viewers,
+            "count": result["count"] if result else None,
+        }
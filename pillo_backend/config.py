@@ -0,0 +1,91 @@
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+# 執行器設定：thread 或 process
+EXECUTOR_MODE = os.environ.get("PILLO_EXECUTOR", "thread")
+# 工作者數量，預設為 CPU 核心數
+EXECUTOR_WORKERS = _env_int("PILLO_WORKERS", os.cpu_count() or 1)
+# 所有工作者都忙碌時，最多可排隊等待的請求數
+EXECUTOR_QUEUE_SIZE = _env_int("PILLO_QUEUE_SIZE", 16)
+# 單一請求的處理逾時（秒）
+EXECUTOR_TIMEOUT = _env_float("PILLO_TIMEOUT", 10.0)
+
+# YOLO 動態批次：同時進來的請求最多合併幾張、第一張最多等待幾毫秒
+YOLO_MAX_BATCH = _env_int("PILLO_YOLO_MAX_BATCH", 8)
+YOLO_MAX_WAIT_MS = _env_float("PILLO_YOLO_MAX_WAIT_MS", 5.0)
+
+# YOLO 模型：預設權重檔、推論後端（torch / onnx / openvino）
+YOLO_WEIGHTS = os.environ.get("PILLO_YOLO_WEIGHTS", "my_model.pt")
+# 其他可選模型，格式為 "nano=yolo11n.pt,final=my_model_l.pt"
+YOLO_MODELS = os.environ.get("PILLO_YOLO_MODELS", "")
+# 常駐模型的記憶體預算（MB），超過時淘汰最久未使用的模型
+YOLO_MEMORY_BUDGET_MB = _env_float("PILLO_YOLO_MEMORY_MB", 1024.0)
+YOLO_BACKEND = os.environ.get("PILLO_YOLO_BACKEND", "torch")
+# 啟動時預先載入並預熱 YOLO，以及預熱推論次數
+YOLO_PRELOAD = _env_int("PILLO_YOLO_PRELOAD", 0) == 1
+YOLO_WARMUP_RUNS = _env_int("PILLO_YOLO_WARMUP_RUNS", 2)
+
+# 結果快取：最多條目數、總大小（MB）與存活秒數，條目數設為 0 時停用
+CACHE_ENTRIES = _env_int("PILLO_CACHE_ENTRIES", 256)
+CACHE_MB = _env_float("PILLO_CACHE_MB", 64.0)
+CACHE_TTL = _env_float("PILLO_CACHE_TTL", 60.0)
+
+# 變化偵測：縮圖像素差異超過 PILLO_MOTION_PIXEL_DELTA 灰階的比例大於
+# PILLO_MOTION_RATIO 時才重新處理，最久沿用 PILLO_MOTION_MAX_STALE 秒
+MOTION_PIXEL_DELTA = _env_int("PILLO_MOTION_PIXEL_DELTA", 20)
+MOTION_RATIO = _env_float("PILLO_MOTION_RATIO", 0.01)
+MOTION_MAX_STALE = _env_float("PILLO_MOTION_MAX_STALE", 10.0)
+# 會話閒置多少秒後淘汰，以及同時保存的會話上限
+SESSION_TTL = _env_float("PILLO_SESSION_TTL", 300.0)
+SESSION_MAX = _env_int("PILLO_SESSION_MAX", 1000)
+
+# 跨影格追蹤：軌跡連續出現幾次才計數、消失幾次才移除，新數量需維持幾張影格才採用
+TRACK_MIN_HITS = _env_int("PILLO_TRACK_MIN_HITS", 2)
+TRACK_MAX_MISSES = _env_int("PILLO_TRACK_MAX_MISSES", 3)
+TRACK_HYSTERESIS = _env_int("PILLO_TRACK_HYSTERESIS", 3)
+
+# 未指定 max_side 的請求預設把處理區域的長邊縮到幾像素，0 表示以原解析度處理
+PROCESS_MAX_SIDE = _env_int("PILLO_MAX_SIDE", 0)
+
+# YOLO 切片推論：auto / on / off、切片邊長（像素）與相鄰切片重疊比例
+TILE_MODE = os.environ.get("PILLO_TILE_MODE", "auto")
+TILE_SIZE = _env_int("PILLO_TILE_SIZE", 1280)
+TILE_OVERLAP = _env_float("PILLO_TILE_OVERLAP", 0.2)
+# auto 模式下，整張縮到 imgsz 的縮小倍數達到此值才切片
+TILE_AUTO_SCALE = _env_float("PILLO_TILE_AUTO_SCALE", 4.0)
+
+# tune.py 產生的參數預設檔，啟動時註冊成具名算法（例如 otsu_tuned）
+PRESETS_PATH = os.environ.get("PILLO_PRESETS", "")
+
+# Prometheus 指標：設為 0 時不記錄也不提供 /metrics
+METRICS_ENABLED = _env_int("PILLO_METRICS", 1) == 1
+
+# 線上效能分析：設為 1 時開放 ?profile=true 與 /api/admin/profile，預設關閉
+PROFILING_ENABLED = _env_int("PILLO_PROFILING", 0) == 1
+
+# serve.py 的工作者行程數，0 表示依可用 CPU 數（含容器配額）決定
+SERVE_WORKERS = _env_int("PILLO_SERVE_WORKERS", 0)
+
+# ultralytics 的匯入時機：background 在啟動後以背景執行緒匯入，lazy 等到第一個 YOLO 請求
+YOLO_IMPORT = os.environ.get("PILLO_YOLO_IMPORT", "background")
+
+# 伺服器端攝影機："名稱=來源" 以逗號分隔，來源為裝置編號、影片檔或串流網址，
+# 例如 "tray=0,demo=videos/tray.mp4"；影片檔播完後從頭循環
+CAMERAS = os.environ.get("PILLO_CAMERAS", "")
+# 伺服器端攝影機每秒偵測幾張影格，以及預設使用的算法
+CAMERA_FPS = _env_float("PILLO_CAMERA_FPS", 5.0)
+CAMERA_ALGORITHM = os.environ.get("PILLO_CAMERA_ALGORITHM", "algorithm2")
+
+# 中間結果陣列緩衝池的閒置上限（MB），依影格尺寸重複使用灰階、模糊、二值化等陣列；0 表示停用。
+# 預設 glibc 設定下反而增加分頁錯誤，搭配 MALLOC_*_THRESHOLD_ 時也與停用差不多，預設停用
+BUFFER_POOL_MB = _env_float("PILLO_BUFFER_POOL_MB", 0.0)
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class QueueFullError(RuntimeError):
+    """等待處理的請求已達上限"""
+
+
+# process 模式下，每個工作者行程各自持有一個處理器實例
+_worker_target = None
+
+
+def _init_worker(factory, warmup, kwargs):
+    global _worker_target
+    _worker_target = factory(**kwargs)
+    if warmup:
+        getattr(_worker_target, warmup)()
+
+
+def _noop():
+    return None
+
+
+def _call_worker(method, args, kwargs):
+    return getattr(_worker_target, method)(*args, **kwargs)
+
+
+class ProcessingExecutor:
+    """把 ImageProcessor 的工作交給執行緒池或行程池，避免阻塞事件迴圈
+
+    同時在處理中與排隊中的請求數量上限為 max_workers + max_queue，
+    超過時 submit 會直接拋出 QueueFullError，由呼叫端回應 503。
+    """
+
+    def __init__(self, target, mode="thread", max_workers=None, max_queue=16, timeout=10.0,
+                 warmup=None, worker_kwargs=None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"不支援的執行模式: {mode}")
+        self.target = target
+        self.mode = mode
+        self.max_workers = max(1, max_workers or 1)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        # 每個處理器實例建立後要先呼叫的方法名稱（例如預載模型）
+        self.warmup = warmup
+        # process 模式下重新建立處理器時使用的參數
+        self.worker_kwargs = worker_kwargs or {}
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+        if mode == "thread":
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="pillo-worker")
+        else:
+            # 行程池中的工作者以相同類別重新建立處理器
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(type(target), warmup, self.worker_kwargs))
+
+    async def start(self):
+        """預先啟動工作者並完成 warmup，避免第一個請求承擔啟動成本"""
+        if self.mode == "thread":
+            if self.warmup:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._pool, getattr(self.target, self.warmup))
+        else:
+            futures = [self._pool.submit(_noop) for _ in range(self.max_workers)]
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def submit(self, method, *args, **kwargs):
+        """在工作者中執行 target.<method>(*args, **kwargs) 並等待結果"""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise QueueFullError("伺服器忙碌中，請稍後再試")
+            self._pending += 1
+
+        try:
+            if self.mode == "thread":
+                future = self._pool.submit(
+                    getattr(self.target, method), *args, **kwargs)
+            else:
+                future = self._pool.submit(_call_worker, method, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        # 名額在工作真正結束時才釋放，逾時的請求仍會佔用直到完成
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "queue_size": self.max_queue,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
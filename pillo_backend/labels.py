@@ -0,0 +1,63 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from tracking import candidate_pairs, greedy_match, iou_matrix
+
+# 專案附帶的標註資料集（YOLO 格式）
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset",
+                               "project-3-at-2025-08-17-14-33-225bb940")
+
+
+def load_dataset(root):
+    """讀取 YOLO 格式資料集，回傳 [(影像路徑, 正規化 cx, cy, w, h 陣列或 None)]
+
+    沒有對應 labels/*.txt 的影像標註為 None，只能用來量測延遲。
+    """
+    samples = []
+    for path in sorted(glob.glob(os.path.join(root, "images", "*"))):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        label = os.path.join(root, "labels", stem + ".txt")
+        boxes = None
+        if os.path.exists(label):
+            rows = np.loadtxt(label, ndmin=2)
+            boxes = rows[:, 1:5] if len(rows) else np.empty((0, 4))
+        samples.append((path, boxes))
+    return samples
+
+
+def image_size(image_bytes, frame=None):
+    """回傳解碼後影像的 (寬, 高)，與算法實際處理的影像一致
+
+    JPEG 標頭記錄的是未旋轉的尺寸，手機照片的 EXIF 方向會讓 cv2.imdecode
+    轉置寬高，因此一律以解碼結果為準；已有解碼的 frame 時直接使用。
+    """
+    if frame is None:
+        frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    height, width = frame.shape[:2]
+    return width, height
+
+
+def to_pixels(normalized, width, height):
+    """正規化的中心點與寬高轉成像素 xyxy"""
+    cx, cy, w, h = np.asarray(normalized, np.float64).reshape(-1, 4).T
+    return np.stack([(cx - w / 2) * width, (cy - h / 2) * height,
+                     (cx + w / 2) * width, (cy + h / 2) * height], axis=1)
+
+
+def match_boxes(pred, truth, iou_threshold=0.5):
+    """以 IoU 貪婪配對預測框與標註框，回傳 (TP, FP, FN)"""
+    if len(pred) == 0 or len(truth) == 0:
+        return 0, len(pred), len(truth)
+    pairs = greedy_match(*candidate_pairs(iou_matrix, truth, pred,
+                                          lambda iou: iou >= iou_threshold))
+    return len(pairs), len(pred) - len(pairs), len(truth) - len(pairs)
+
+
+def precision_recall(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
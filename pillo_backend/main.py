@@ -1,20 +1,62 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import cv2
-import numpy as np
+import asyncio
+import functools
 import uvicorn
-import base64
-from typing import Optional
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Optional
 import json
+import os
+import time
 from datetime import datetime
-from utils import get_local_ip, get_all_ips
-try:
-    from ultralytics import YOLO
-except Exception:
-    YOLO = None
-
-app = FastAPI(title="影像處理 API", version="2.0.0")
+from utils import get_local_ip
+import config
+import metrics
+import profiling
+from cache import ResultCache
+from camera import CameraService, parse_camera_specs
+from executor import ProcessingExecutor, QueueFullError
+from pipeline import ALGORITHMS, DEFAULT_ALGORITHM
+from processor import ImageProcessor, YOLO, decode_base64
+from sessions import MotionGate, Session, SessionStore, motion_thumbnail
+from streaming import DetectionStream
+from tracking import CountTracker
+from yolo_export import resolve_weights
+
+
+async def preload_yolo():
+    try:
+        if config.YOLO_BACKEND != "torch":
+            # 先在主行程完成匯出，避免多個工作者同時匯出同一個模型
+            await asyncio.to_thread(resolve_weights, config.YOLO_WEIGHTS, config.YOLO_BACKEND)
+        await executor.start()
+    except Exception as e:
+        print(f"⚠️ YOLO 預載失敗: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # YOLO 在背景準備，Otsu / Canny 不必等它就能開始服務；
+    # 準備期間進來的 YOLO 請求會等待同一次載入完成
+    preload = None
+    if config.YOLO_PRELOAD and YOLO.installed:
+        preload = asyncio.ensure_future(preload_yolo())
+    elif config.YOLO_IMPORT == "background" and config.EXECUTOR_MODE == "thread":
+        # process 模式下推論在工作者行程中進行，主行程不需要 ultralytics
+        YOLO.load_in_background()
+    for camera in cameras.values():
+        camera.start()
+    yield
+    if preload is not None and not preload.done():
+        preload.cancel()
+    for camera in cameras.values():
+        await asyncio.to_thread(camera.stop)
+    executor.shutdown()
+
+
+app = FastAPI(title="影像處理 API", version="2.0.0", lifespan=lifespan)
 
 # 允許跨域請求
 app.add_middleware(
@@ -23,7 +65,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 讓瀏覽器讀得到二進位回應附帶的結果標頭
+    expose_headers=["X-Pill-Count", "X-Algorithm", "X-Stale-Since"],
 )
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 
 
 # 請求模型
@@ -32,130 +78,227 @@ app.add_middleware(
 class ImageProcessingRequest(BaseModel):
     image_data: str  # base64 編碼的影像
     algorithm: str = "algorithm2"  # algorithm1, algorithm2, yolo11
+    output: str = "image"  # count, geometry, image
+    # yolo11 專用：模型名稱與推論參數，未指定時使用預設值
+    model: Optional[str] = None
+    imgsz: Optional[int] = None
+    conf: Optional[float] = None
+    iou: Optional[float] = None
+    # 帶入 session_id（或 X-Session-Id 標頭）時啟用變化偵測，畫面未變化就沿用上次結果
+    session_id: Optional[str] = None
+    # 搭配 session_id 使用：跨影格追蹤物件，回傳穩定數量與物件 ID
+    track: bool = False
+    # 只處理 [x, y, w, h] 區域，並把處理區域的長邊縮到 max_side 像素
+    roi: Optional[List[int]] = None
+    max_side: Optional[int] = None
+    # yolo11 切片推論：auto、on 或 off，以及切片邊長與重疊比例
+    tiling: Optional[str] = None
+    tile_size: Optional[int] = None
+    tile_overlap: Optional[float] = None
+
+    def options(self):
+        return request_options(self.model, self.imgsz, self.conf, self.iou, self.track,
+                               self.roi, self.max_side, self.tiling, self.tile_size,
+                               self.tile_overlap)
+
+
+def request_options(model=None, imgsz=None, conf=None, iou=None, track=False, roi=None,
+                    max_side=None, tiling=None, tile_size=None, tile_overlap=None):
+    if isinstance(roi, str):
+        roi = parse_roi(roi)
+    if max_side is None and config.PROCESS_MAX_SIDE > 0:
+        max_side = config.PROCESS_MAX_SIDE
+    options = {"model": model, "imgsz": imgsz, "conf": conf, "iou": iou, "roi": roi,
+               "max_side": max_side, "tiling": tiling, "tile_size": tile_size,
+               "tile_overlap": tile_overlap}
+    options = {k: v for k, v in options.items() if v is not None}
+    if track:
+        options["track"] = True
+    return options
+
+
+def parse_roi(text):
+    """解析查詢參數中的 "x,y,w,h" """
+    try:
+        return [int(v) for v in text.split(",")]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"roi 格式應為 x,y,w,h: {text}")
+
+
+class CompareRequest(BaseModel):
+    image_data: str  # base64 編碼的影像
+    algorithms: List[str] = ["algorithm1", "algorithm2", "yolo11"]
+    output: str = "count"  # count, geometry
+    model: Optional[str] = None
+    imgsz: Optional[int] = None
+    conf: Optional[float] = None
+    iou: Optional[float] = None
+    roi: Optional[List[int]] = None
+    max_side: Optional[int] = None
+    tiling: Optional[str] = None
+    tile_size: Optional[int] = None
+    tile_overlap: Optional[float] = None
+
+    def options(self):
+        return request_options(self.model, self.imgsz, self.conf, self.iou, roi=self.roi,
+                               max_side=self.max_side, tiling=self.tiling,
+                               tile_size=self.tile_size, tile_overlap=self.tile_overlap)
 
 
 class AlgorithmRequest(BaseModel):
     algorithm: str
 
 
-class ImageProcessor:
-    def __init__(self):
-        self.algorithm = "algorithm2"
-        self.yolo_model = None
-
-    def ensure_yolo_loaded(self):
-        if self.yolo_model is None:
-            if YOLO is None:
-                raise RuntimeError("Ultralytics YOLO 未安裝，請安裝 ultralytics 套件")
-            self.yolo_model = YOLO("my_model.pt")
-
-    def process_image(self, image_data: str, algorithm: str = None):
-        """處理影像並回傳結果"""
-        try:
-            # 解碼 base64 影像
-            image_bytes = base64.b64decode(image_data.split(
-                ',')[1] if ',' in image_data else image_data)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            if frame is None:
-                raise ValueError("無法解碼影像")
-
-            # 創建顯示用的影像副本
-            display_frame = frame.copy()
-
-            # 根據算法處理影像
-            if algorithm == "yolo11":
-                count = self.process_yolo(frame, display_frame)
-            elif algorithm == "algorithm1":
-                count = self.process_contours_otsu(frame, display_frame)
-            else:  # algorithm2
-                count = self.process_contours_canny(frame, display_frame)
-
-            # 編碼處理後的影像
-            ret, buffer = cv2.imencode('.jpg', display_frame, [
-                                       cv2.IMWRITE_JPEG_QUALITY, 80])
-            if ret:
-                processed_image = base64.b64encode(buffer).decode('utf-8')
-                return {
-                    "success": True,
-                    "processed_image": f"data:image/jpeg;base64,{processed_image}",
-                    "count": count,
-                    "algorithm": algorithm
-                }
-            else:
-                raise ValueError("無法編碼處理後的影像")
-
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "count": 0
-            }
-
-    def process_contours_otsu(self, frame, display_frame):
-        """Otsu 二值化輪廓偵測"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (7, 7), 0)
-        _, thresh = cv2.threshold(
-            blur, 80, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        contours, _ = cv2.findContours(
-            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        count = len(contours)
-        cv2.drawContours(display_frame, contours, -1, (0, 255, 0), 2)
-        cv2.putText(display_frame, f"Otsu Count: {count}", (20, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3, cv2.LINE_AA)
-        return count
-
-    def process_contours_canny(self, frame, display_frame):
-        """Canny 邊緣偵測輪廓"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (7, 7), 0)
-        canny = cv2.Canny(blur, 100, 150, 3)
-        dilated = cv2.dilate(canny, (1, 1), iterations=0)
-        contours, _ = cv2.findContours(
-            dilated.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-
-        count = len(contours)
-        cv2.drawContours(display_frame, contours, -1, (0, 255, 0), 2)
-        cv2.putText(display_frame, f"Canny Count: {count}", (20, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3, cv2.LINE_AA)
-        return count
-
-    def process_yolo(self, frame, display_frame):
-        """YOLO 物件偵測"""
-        self.ensure_yolo_loaded()
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.yolo_model.predict(source=rgb, verbose=False, imgsz=640,
-                                          conf=0.25, iou=0.45, device='cpu')
-
-        r = results[0]
-        boxes = r.boxes
-        count = 0
-
-        if boxes is not None:
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                conf = float(box.conf[0].cpu().numpy()
-                             ) if box.conf is not None else 0.0
-                cls_id = int(box.cls[0].cpu().numpy()
-                             ) if box.cls is not None else -1
-                count += 1
-
-                cv2.rectangle(display_frame, (x1, y1),
-                              (x2, y2), (0, 255, 0), 2)
-                label = f"ID{cls_id} {conf:.2f}"
-                cv2.putText(display_frame, label, (x1, max(y1-5, 10)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-
-        cv2.putText(display_frame, f"YOLO Count: {count}", (20, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3, cv2.LINE_AA)
-        return count
+class CameraSettingsRequest(BaseModel):
+    algorithm: Optional[str] = None
+    detect_fps: Optional[float] = None
+    model: Optional[str] = None
+    imgsz: Optional[int] = None
+    conf: Optional[float] = None
+    iou: Optional[float] = None
+    roi: Optional[List[int]] = None
+    max_side: Optional[int] = None
 
 
 # 創建影像處理器實例
 processor = ImageProcessor()
+# 影像處理在工作者池中執行，不佔用事件迴圈
+executor = ProcessingExecutor(
+    processor,
+    mode=config.EXECUTOR_MODE,
+    max_workers=config.EXECUTOR_WORKERS,
+    max_queue=config.EXECUTOR_QUEUE_SIZE,
+    timeout=config.EXECUTOR_TIMEOUT,
+    warmup="warmup_yolo" if config.YOLO_PRELOAD else None,
+    # 每個工作者行程一次只處理一個請求，動態批次只會多等 max_wait_ms
+    worker_kwargs={"yolo_max_batch": 1},
+)
+
+
+# 以影像內容雜湊為鍵的結果快取，重複上傳的影像不必重新計算
+result_cache = ResultCache(
+    max_entries=config.CACHE_ENTRIES,
+    max_bytes=int(config.CACHE_MB * 1024 * 1024),
+    ttl=config.CACHE_TTL,
+)
+
+# 超過此大小的影像改在執行緒中計算雜湊，避免阻塞事件迴圈
+INLINE_HASH_BYTES = 256 * 1024
+
+# 即時攝影機會話：以低解析度影格差異判斷畫面是否變化，靜止時不重跑偵測
+frame_gate = MotionGate(
+    pixel_delta=config.MOTION_PIXEL_DELTA,
+    changed_ratio=config.MOTION_RATIO,
+    max_stale=config.MOTION_MAX_STALE,
+)
+new_tracker = functools.partial(
+    CountTracker,
+    min_hits=config.TRACK_MIN_HITS,
+    max_misses=config.TRACK_MAX_MISSES,
+    hysteresis=config.TRACK_HYSTERESIS,
+)
+sessions = SessionStore(frame_gate, new_tracker, ttl=config.SESSION_TTL,
+                        max_sessions=config.SESSION_MAX)
+
+# 伺服器端攝影機：各自在背景執行緒中擷取與偵測，不經過執行器
+cameras = {
+    name: CameraService(name, source, processor, config.CAMERA_ALGORITHM, config.CAMERA_FPS,
+                        request_options())
+    for name, source in parse_camera_specs(config.CAMERAS).items()
+}
+
+
+@contextmanager
+def executor_errors():
+    """把執行器滿載與逾時轉成 503 / 504 回應"""
+    try:
+        yield
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="影像處理逾時")
+
+
+async def run_processor(method, *args, **kwargs):
+    """在執行器中呼叫處理器，滿載時回應 503、逾時回應 504"""
+    with executor_errors():
+        return await executor.submit(method, *args, **kwargs)
+
+
+async def process_frame(image_bytes, algorithm=None, image_format="base64", output="image",
+                        options=None, session=None, motion_gate=True):
+    """處理單張影格：有會話時先做變化偵測，再查結果快取，都未命中才交給執行器
+
+    會話中的畫面與上次處理的影格相比沒有明顯變化時，直接回傳上次結果，
+    並以 stale / stale_since 標示。options 含 track 時以會話的追蹤器
+    更新軌跡，結果附上 tracking。滿載或逾時時拋出 QueueFullError /
+    asyncio.TimeoutError。
+    """
+    algorithm = algorithm or DEFAULT_ALGORITHM
+    start = time.perf_counter()
+    try:
+        result = await _process_frame(image_bytes, algorithm, image_format, output, options,
+                                      session, motion_gate)
+    except QueueFullError:
+        metrics.record_rejected(algorithm, output, "rejected")
+        raise
+    except asyncio.TimeoutError:
+        metrics.record_rejected(algorithm, output, "timeout")
+        raise
+    metrics.record_frame(algorithm, output, image_bytes, result, time.perf_counter() - start)
+    return result
+
+
+async def _process_frame(image_bytes, algorithm, image_format, output, options, session,
+                         motion_gate):
+    if session is None:
+        result = await _process_uncached(image_bytes, algorithm, image_format, output, options)
+        result.pop("bboxes", None)
+        return result
+
+    thumb = None
+    motion = None
+    request_key = (algorithm, image_format, output, json.dumps(options or {}, sort_keys=True))
+    if motion_gate:
+        thumb = await asyncio.to_thread(motion_thumbnail, image_bytes)
+        reused, motion = session.reuse(thumb, request_key)
+        if reused is not None:
+            return reused
+
+    result = await _process_uncached(image_bytes, algorithm, image_format, output, options)
+    bboxes = result.pop("bboxes", None)
+    if bboxes is not None:
+        # 影像格式與輸出模式不影響偵測結果，只有算法與參數改變時重新追蹤
+        tracker = session.get_tracker((algorithm, request_key[3]))
+        tracking = await asyncio.to_thread(tracker.update, bboxes)
+        if output == "geometry":
+            tracking["objects"] = tracker.objects()
+        result["tracking"] = tracking
+    if motion_gate:
+        session.update(thumb, request_key, result)
+        result.update(stale=False, motion=round(motion, 4))
+    return result
+
+
+async def _process_uncached(image_bytes, algorithm, image_format, output, options):
+    key = None
+    if result_cache.enabled:
+        args = (image_bytes, algorithm, image_format, output, options)
+        if len(image_bytes) > INLINE_HASH_BYTES:
+            key = await asyncio.to_thread(ResultCache.make_key, *args)
+        else:
+            key = ResultCache.make_key(*args)
+        cached = result_cache.get(key)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+
+    result = await executor.submit("process_bytes", image_bytes, algorithm, image_format,
+                                   output, options)
+    if key is not None and result.get("success"):
+        result_cache.put(key, result)
+    return result
 
 
 @app.get("/")
@@ -163,13 +306,249 @@ async def root():
     return {"message": "影像處理 API 服務運行中", "version": "2.0.0"}
 
 
+def get_session(session_id):
+    return sessions.get(session_id) if session_id else None
+
+
+def profiling_requested(profile, header):
+    """請求以 ?profile=true 或 X-Profile 標頭要求效能分析；未開啟 PILLO_PROFILING 時回應 403"""
+    if not profile and header not in ("1", "true"):
+        return False
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="效能分析未啟用，請以 PILLO_PROFILING=1 啟動")
+    return True
+
+
 @app.post("/api/process-image")
-async def process_image(request: ImageProcessingRequest):
-    """處理影像並回傳結果"""
-    result = processor.process_image(request.image_data, request.algorithm)
+async def process_image(request: ImageProcessingRequest,
+                        x_session_id: Optional[str] = Header(None), profile: bool = False,
+                        x_profile: Optional[str] = Header(None)):
+    """處理影像並回傳結果；要求效能分析時略過快取與變化偵測，結果附上 profile"""
+    profiled = profiling_requested(profile, x_profile)
+    start = time.perf_counter()
+    try:
+        image_bytes = decode_base64(request.image_data)
+    except Exception as e:
+        metrics.record_error(request.algorithm, e)
+        return {"success": False, "error": str(e), "error_type": type(e).__name__, "count": 0}
+    metrics.record_stage(request.algorithm, "base64", time.perf_counter() - start)
+    if profiled:
+        return await run_processor("profile_bytes", image_bytes, request.algorithm, "base64",
+                                   request.output, request.options())
+    session = get_session(request.session_id or x_session_id)
+    with executor_errors():
+        return await process_frame(image_bytes, request.algorithm, "base64",
+                                   request.output, request.options(), session)
+
+
+@app.post("/api/process-image/raw")
+async def process_image_raw(request: Request, algorithm: str = "algorithm2",
+                            response_format: str = "json", output: str = "image",
+                            model: Optional[str] = None, imgsz: Optional[int] = None,
+                            conf: Optional[float] = None, iou: Optional[float] = None,
+                            roi: Optional[str] = None, max_side: Optional[int] = None,
+                            tiling: Optional[str] = None, tile_size: Optional[int] = None,
+                            tile_overlap: Optional[float] = None,
+                            session_id: Optional[str] = None, track: bool = False,
+                            x_session_id: Optional[str] = Header(None), profile: bool = False,
+                            x_profile: Optional[str] = Header(None)):
+    """處理二進位影像（image/jpeg 本體或 multipart 上傳）
+
+    response_format 為 "jpeg" 時直接回傳標註後的 JPEG，數量與算法放在
+    X-Pill-Count / X-Algorithm 標頭；為 "json" 時回傳與
+    /api/process-image 相同格式的結果。roi 為 "x,y,w,h"。帶入 session_id
+    時啟用變化偵測，再加上 track=true 時跨影格追蹤物件。profile=true
+    （或 X-Profile: 1）時以 cProfile 執行，只支援 json 回應格式。
+    """
+    if response_format not in ("json", "jpeg"):
+        raise HTTPException(status_code=400, detail=f"不支援的回應格式: {response_format}")
+    if response_format == "jpeg" and output != "image":
+        raise HTTPException(status_code=400, detail="jpeg 回應格式需搭配 output=image")
+    profiled = profiling_requested(profile, x_profile)
+    if profiled and response_format != "json":
+        raise HTTPException(status_code=400, detail="效能分析只支援 json 回應格式")
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image") or form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="缺少 image 檔案欄位")
+        image_bytes = await upload.read()
+        algorithm = form.get("algorithm") or algorithm
+        output = form.get("output") or output
+    else:
+        image_bytes = await request.body()
+
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="影像內容為空")
+
+    image_format = "jpeg" if response_format == "jpeg" else "base64"
+    if profiled:
+        return await run_processor("profile_bytes", image_bytes, algorithm, image_format, output,
+                                   request_options(model, imgsz, conf, iou, False, roi, max_side,
+                                                   tiling, tile_size, tile_overlap))
+    with executor_errors():
+        result = await process_frame(image_bytes, algorithm, image_format, output,
+                                     request_options(model, imgsz, conf, iou, track, roi, max_side,
+                                                     tiling, tile_size, tile_overlap),
+                                     get_session(session_id or x_session_id))
+
+    if response_format == "jpeg":
+        if not result["success"]:
+            return JSONResponse(result, status_code=422)
+        headers = {
+            "X-Pill-Count": str(result["count"]),
+            "X-Algorithm": str(result["algorithm"]),
+        }
+        if result.get("stale"):
+            headers["X-Stale-Since"] = str(result["stale_since"])
+        return Response(content=result["processed_jpeg"], media_type="image/jpeg",
+                        headers=headers)
+    return result
+
+
+@app.post("/api/compare")
+async def compare_algorithms(request: CompareRequest):
+    """解碼一次並在同一張影格上執行多個算法，回傳各自的數量與耗時"""
+    try:
+        image_bytes = decode_base64(request.image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"無法解碼 base64 影像: {e}")
+    result = await run_processor("compare_bytes", image_bytes, request.algorithms,
+                                 request.output, request.options())
+    metrics.record_compare(result)
+    return result
+
+
+@app.post("/api/compare/raw")
+async def compare_algorithms_raw(request: Request,
+                                 algorithms: str = "algorithm1,algorithm2,yolo11",
+                                 output: str = "count", model: Optional[str] = None,
+                                 imgsz: Optional[int] = None, conf: Optional[float] = None,
+                                 iou: Optional[float] = None, roi: Optional[str] = None,
+                                 max_side: Optional[int] = None, tiling: Optional[str] = None,
+                                 tile_size: Optional[int] = None,
+                                 tile_overlap: Optional[float] = None):
+    """與 /api/compare 相同，但直接上傳 image/jpeg 本體"""
+    image_bytes = await request.body()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="影像內容為空")
+    names = [name.strip() for name in algorithms.split(",") if name.strip()]
+    result = await run_processor("compare_bytes", image_bytes, names, output,
+                                 request_options(model, imgsz, conf, iou, roi=roi,
+                                                 max_side=max_side, tiling=tiling,
+                                                 tile_size=tile_size, tile_overlap=tile_overlap))
+    metrics.record_compare(result)
     return result
 
 
+@app.websocket("/ws/detect")
+async def websocket_detect(websocket: WebSocket, algorithm: str = "algorithm2",
+                           annotate: bool = False, output: str = "count",
+                           motion_gate: bool = False):
+    """連續偵測串流：推送二進位 JPEG 影格，接收數量與（選擇性）標註影像
+
+    每條連線有自己的會話：motion_gate 開啟時畫面靜止就沿用上次結果，
+    設定 {"track": true} 時跨影格追蹤物件。
+    """
+    await websocket.accept()
+    session = Session(f"ws-{id(websocket)}", frame_gate, new_tracker)
+    process = functools.partial(process_frame, session=session, motion_gate=motion_gate)
+    stream = DetectionStream(websocket, process, algorithm, annotate, output)
+    try:
+        await stream.run()
+    except WebSocketDisconnect:
+        pass
+
+
+def get_camera(name):
+    camera = cameras.get(name)
+    if camera is None:
+        raise HTTPException(status_code=404, detail=f"未知的攝影機: {name}")
+    return camera
+
+
+@app.get("/api/cameras")
+async def list_cameras():
+    """列出伺服器端攝影機與其擷取、偵測狀態"""
+    return [camera.stats() for camera in cameras.values()]
+
+
+@app.get("/api/cameras/{name}")
+async def get_camera_status(name: str):
+    """單一攝影機的狀態與最新一次偵測結果"""
+    camera = get_camera(name)
+    _, _, result = camera.broadcast.latest()
+    return {**camera.stats(), "result": result}
+
+
+@app.post("/api/cameras/{name}/settings")
+async def update_camera(name: str, request: CameraSettingsRequest):
+    """變更攝影機的算法、偵測頻率或推論參數，下一張影格起生效"""
+    camera = get_camera(name)
+    options = None
+    if any(v is not None for v in (request.model, request.imgsz, request.conf, request.iou,
+                                   request.roi, request.max_side)):
+        options = request_options(request.model, request.imgsz, request.conf, request.iou,
+                                  roi=request.roi, max_side=request.max_side)
+    try:
+        camera.configure(request.algorithm, request.detect_fps, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return camera.stats()
+
+
+def camera_headers(result):
+    return {"X-Pill-Count": str(result["count"]), "X-Algorithm": str(result["algorithm"])}
+
+
+@app.get("/api/cameras/{name}/snapshot")
+async def camera_snapshot(name: str):
+    """最新一張標註後的 JPEG，數量與算法放在 X-Pill-Count / X-Algorithm 標頭"""
+    camera = get_camera(name)
+    _, jpeg, result = camera.broadcast.latest()
+    if jpeg is None:
+        raise HTTPException(status_code=503, detail="攝影機尚未產生影格",
+                            headers={"Retry-After": "1"})
+    return Response(content=jpeg, media_type="image/jpeg", headers=camera_headers(result))
+
+
+@app.get("/api/cameras/{name}/mjpeg")
+async def camera_mjpeg(name: str):
+    """multipart/x-mixed-replace 串流，可直接放在 <img src> 中觀看
+
+    所有觀看者共用偵測執行緒編碼好的同一份 JPEG；觀看者跟不上時略過舊影格。
+    """
+    camera = get_camera(name)
+
+    async def parts():
+        async for _, jpeg, _ in camera.broadcast.frames():
+            yield (b"--frame\r\nContent-Type: image/jpeg\r\n"
+                   b"Content-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n")
+            yield jpeg
+            yield b"\r\n"
+
+    return StreamingResponse(parts(), media_type="multipart/x-mixed-replace; boundary=frame")
+
+
+@app.websocket("/ws/cameras/{name}")
+async def camera_websocket(websocket: WebSocket, name: str, annotate: bool = True):
+    """推送攝影機的每一個偵測結果（JSON），annotate 開啟時緊接著送出標註後的 JPEG"""
+    camera = cameras.get(name)
+    if camera is None:
+        await websocket.close(code=4404, reason=f"未知的攝影機: {name}")
+        return
+    await websocket.accept()
+    try:
+        async for _, jpeg, result in camera.broadcast.frames():
+            await websocket.send_json(result)
+            if annotate:
+                await websocket.send_bytes(jpeg)
+    except WebSocketDisconnect:
+        pass
+
+
 @app.post("/api/algorithm/change")
 async def change_algorithm(request: AlgorithmRequest):
     """更改處理算法"""
@@ -177,16 +556,73 @@ async def change_algorithm(request: AlgorithmRequest):
     return {"success": True, "message": f"算法已更改為 {request.algorithm}"}
 
 
+@app.get("/api/algorithms")
+async def list_algorithms():
+    """列出已註冊的算法與其處理階段"""
+    return [pipeline.describe() for pipeline in ALGORITHMS.values()]
+
+
+@app.get("/api/models")
+async def list_models():
+    """列出可選的 YOLO 模型與目前常駐的模型"""
+    return processor.models.stats()
+
+
 @app.get("/api/status")
 async def get_status():
     """獲取服務狀態"""
     return {
         "status": "running",
+        # serve.py 多工作者模式下用來分辨回應的工作者
+        "pid": os.getpid(),
         "algorithm": processor.algorithm,
-        "yolo_available": YOLO is not None,
+        "yolo_available": YOLO.installed,
+        "yolo_import": YOLO.stats(),
+        "yolo_models": processor.models.stats(),
+        "executor": executor.stats(),
+        "cache": result_cache.stats(),
+        "sessions": sessions.stats(),
+        "buffers": processor.buffers.stats(),
+        "cameras": len(cameras),
         "timestamp": datetime.now().strftime('%H:%M:%S')
     }
 
+
+@app.get("/api/admin/profile")
+async def sample_profile(seconds: float = 10.0, interval_ms: float = 5.0, idle: bool = False):
+    """取樣整個行程的堆疊 seconds 秒，回傳 flamegraph.pl / speedscope 可讀的 collapsed 格式
+
+    idle 為 false 時略過等待鎖、佇列或 I/O 的閒置執行緒。
+    """
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="效能分析未啟用，請以 PILLO_PROFILING=1 啟動")
+    if not 0 < seconds <= 60:
+        raise HTTPException(status_code=400, detail="seconds 必須介於 0 與 60 之間")
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms 必須介於 1 與 1000 之間")
+    try:
+        text, samples = await asyncio.to_thread(profiling.sample_stacks, seconds,
+                                                interval_ms / 1000.0, idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(text, headers={"X-Profile-Samples": str(samples)})
+
+
+@metrics.REGISTRY.on_collect
+def collect_status():
+    # process 模式下模型與緩衝池在工作者行程中，主行程看不到它們的統計
+    metrics.observe_status(executor.stats(), processor.models.stats(), result_cache.stats(),
+                           sessions.stats(), processor.buffers.stats())
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文字格式的指標"""
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="指標已停用（PILLO_METRICS=0）")
+    text = await asyncio.to_thread(metrics.REGISTRY.render)
+    return PlainTextResponse(text, media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     local_ip = get_local_ip()
     print(f"🌐 本機IP: {local_ip}")
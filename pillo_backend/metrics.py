@@ -0,0 +1,377 @@
+"""Prometheus 文字格式的指標
+
+不依賴 prometheus_client：計數器、量表與直方圖都只在記憶體中累加，
+GET /metrics 時才整理成文字。處理結果的 timings 在主行程中記錄，
+因此 thread 與 process 兩種執行模式都能觀測到各階段耗時。
+"""
+import bisect
+import math
+import threading
+import time
+
+import config
+from pipeline import ALGORITHMS
+from roi import jpeg_size
+
+# 各處理階段歸入的類別，新的階段未列出時歸入 detect
+STAGE_GROUPS = {
+    "decode": "decode", "resize": "decode",
+    "gray": "preprocess", "rgb": "preprocess", "blur": "preprocess",
+    "threshold": "preprocess", "canny": "preprocess", "morphology": "preprocess",
+    "annotate": "annotate",
+    "encode": "encode",
+    "base64": "base64",
+}
+
+# 直方圖的上界：耗時（秒）、影格大小（位元組）與解析度（百萬像素）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+BYTES_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6)
+MEGAPIXEL_BUCKETS = (0.3, 1.0, 2.0, 5.0, 12.0, 24.0, 50.0)
+
+# 影格的輸出模式標籤，compare 表示 /api/compare 中的單一算法
+OUTPUT_LABELS = ("count", "geometry", "image", "compare")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def stage_group(stage):
+    return STAGE_GROUPS.get(stage, "detect")
+
+
+def _algorithm_label(name):
+    # 請求帶入的未知算法名稱一律歸為 unknown，避免標籤組合無限增加
+    return name if name in ALGORITHMS else "unknown"
+
+
+def _output_label(output):
+    return output if output in OUTPUT_LABELS else "unknown"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 的標籤應為 {', '.join(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, *extra):
+        return tuple(zip(self.labelnames, key)) + extra
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """只增不減的累計值"""
+
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value, **labels):
+        """以其他模組自行維護的累計值（例如執行器的拒絕次數）覆寫"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Gauge(Counter):
+    """可增可減的瞬時值"""
+
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各區間（非累積）的次數、總和與總次數
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, n)) for key, (counts, total, n)
+                     in self._values.items()]
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket", self._labels(key, ("le", _format_value(bound))),
+                       cumulative)
+            yield f"{self.name}_sum", self._labels(key), total
+            yield f"{self.name}_count", self._labels(key), n
+
+
+class MetricsRegistry:
+    """指標登錄表；on_collect 註冊的函式在每次輸出前執行，用來同步量表"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def on_collect(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"⚠️ 指標收集失敗: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+FRAMES = REGISTRY.counter(
+    "pillo_frames_total",
+    "處理的影格數；outcome 為 success、error、cached、stale、rejected 或 timeout",
+    ("algorithm", "output", "outcome"))
+FRAME_SECONDS = REGISTRY.histogram(
+    "pillo_frame_duration_seconds", "單張影格從收到到產生結果的耗時，含排隊與快取查詢",
+    ("algorithm", "output"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "pillo_stage_duration_seconds",
+    "各類處理階段的耗時：decode、preprocess、detect、annotate、encode、base64",
+    ("algorithm", "group"))
+PIPELINE_STAGE_SECONDS = REGISTRY.counter(
+    "pillo_pipeline_stage_seconds_total", "各管線階段的累計耗時，用來找出最耗時的階段",
+    ("algorithm", "stage"))
+FRAME_BYTES = REGISTRY.histogram(
+    "pillo_frame_bytes", "收到的影像大小（位元組）", (), BYTES_BUCKETS)
+FRAME_MEGAPIXELS = REGISTRY.histogram(
+    "pillo_frame_megapixels", "收到的 JPEG 影像解析度（百萬像素）", (), MEGAPIXEL_BUCKETS)
+ERRORS = REGISTRY.counter(
+    "pillo_errors_total", "處理失敗的次數，type 為例外類別", ("algorithm", "type"))
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "pillo_http_requests_total", "HTTP 請求數", ("method", "route", "status"))
+HTTP_SECONDS = REGISTRY.histogram(
+    "pillo_http_request_duration_seconds", "HTTP 請求耗時", ("method", "route"))
+HTTP_IN_FLIGHT = REGISTRY.gauge("pillo_http_requests_in_flight", "處理中的 HTTP 請求數")
+
+EXECUTOR_PENDING = REGISTRY.gauge(
+    "pillo_executor_pending", "執行器中處理中與排隊中的請求數")
+EXECUTOR_CAPACITY = REGISTRY.gauge(
+    "pillo_executor_capacity", "執行器可同時接受的請求數（工作者數 + 佇列長度）")
+EXECUTOR_EVENTS = REGISTRY.counter(
+    "pillo_executor_events_total", "執行器完成、拒絕與逾時的請求數", ("event",))
+YOLO_LOAD_SECONDS = REGISTRY.gauge(
+    "pillo_yolo_load_seconds", "常駐 YOLO 模型的載入耗時", ("model",))
+YOLO_BATCH_FRAMES = REGISTRY.counter(
+    "pillo_yolo_batched_frames_total", "經過動態批次推論的影格數", ("model",))
+YOLO_BATCHES = REGISTRY.counter(
+    "pillo_yolo_batches_total", "動態批次推論的次數", ("model",))
+CACHE_EVENTS = REGISTRY.counter(
+    "pillo_cache_events_total", "結果快取命中、未命中與淘汰次數", ("event",))
+CACHE_BYTES = REGISTRY.gauge("pillo_cache_bytes", "結果快取佔用的位元組數")
+SESSIONS_ACTIVE = REGISTRY.gauge("pillo_sessions_active", "保存中的攝影機會話數")
+BUFFER_POOL_BYTES = REGISTRY.gauge(
+    "pillo_buffer_pool_bytes", "緩衝池中閒置與借出中的陣列位元組數", ("state",))
+BUFFER_POOL_EVENTS = REGISTRY.counter(
+    "pillo_buffer_pool_events_total", "緩衝池重複使用、新配置與淘汰的陣列數", ("event",))
+
+
+def record_frame(algorithm, output, image_bytes, result, seconds):
+    """記錄一張影格的結果；快取命中或沿用上次結果時不重複計入各階段耗時"""
+    if not config.METRICS_ENABLED:
+        return
+    algorithm = _algorithm_label(algorithm)
+    output = _output_label(output)
+    if result.get("cached"):
+        outcome = "cached"
+    elif result.get("stale"):
+        outcome = "stale"
+    else:
+        outcome = "success" if result.get("success") else "error"
+    FRAMES.inc(algorithm=algorithm, output=output, outcome=outcome)
+    FRAME_SECONDS.observe(seconds, algorithm=algorithm, output=output)
+    FRAME_BYTES.observe(len(image_bytes))
+    size = jpeg_size(image_bytes)
+    if size is not None:
+        FRAME_MEGAPIXELS.observe(size[0] * size[1] / 1e6)
+    if outcome == "error":
+        ERRORS.inc(algorithm=algorithm, type=result.get("error_type", "Exception"))
+    elif outcome == "success":
+        record_timings(algorithm, result.get("timings", {}))
+
+
+def record_timings(algorithm, timings):
+    """把處理器回傳的各階段耗時（毫秒）依類別加總後記錄"""
+    if not config.METRICS_ENABLED:
+        return
+    groups = {}
+    for stage, ms in timings.items():
+        PIPELINE_STAGE_SECONDS.inc(ms / 1000.0, algorithm=algorithm, stage=stage)
+        group = stage_group(stage)
+        groups[group] = groups.get(group, 0.0) + ms
+    for group, ms in groups.items():
+        STAGE_SECONDS.observe(ms / 1000.0, algorithm=algorithm, group=group)
+
+
+def record_compare(result):
+    """記錄 compare_bytes 的結果，每個算法各算一張影格"""
+    if not config.METRICS_ENABLED:
+        return
+    if not result.get("success"):
+        ERRORS.inc(algorithm="compare", type=result.get("error_type", "Exception"))
+        return
+    record_timings("compare", result.get("timings", {}))
+    for name, entry in result["results"].items():
+        name = _algorithm_label(name)
+        outcome = "success" if entry["success"] else "error"
+        FRAMES.inc(algorithm=name, output="compare", outcome=outcome)
+        FRAME_SECONDS.observe(entry["latency_ms"] / 1000.0, algorithm=name, output="compare")
+        if entry["success"]:
+            record_timings(name, entry.get("timings", {}))
+        else:
+            ERRORS.inc(algorithm=name, type=entry.get("error_type", "Exception"))
+
+
+def record_rejected(algorithm, output, outcome):
+    """執行器滿載（rejected）或逾時（timeout）時沒有結果可記錄，只計數"""
+    if config.METRICS_ENABLED:
+        FRAMES.inc(algorithm=_algorithm_label(algorithm), output=_output_label(output),
+                   outcome=outcome)
+
+
+def record_error(algorithm, error):
+    """處理器以外（例如 base64 解碼）的失敗"""
+    if config.METRICS_ENABLED:
+        ERRORS.inc(algorithm=_algorithm_label(algorithm), type=type(error).__name__)
+
+
+def record_stage(algorithm, stage, seconds):
+    if config.METRICS_ENABLED:
+        algorithm = _algorithm_label(algorithm)
+        PIPELINE_STAGE_SECONDS.inc(seconds, algorithm=algorithm, stage=stage)
+        STAGE_SECONDS.observe(seconds, algorithm=algorithm, group=stage_group(stage))
+
+
+def observe_status(executor=None, models=None, cache=None, sessions=None, buffers=None):
+    """以各元件 stats() 的內容同步量表與累計值"""
+    if executor is not None:
+        EXECUTOR_PENDING.set(executor["pending"])
+        EXECUTOR_CAPACITY.set(executor["workers"] + executor["queue_size"])
+        for event in ("completed", "rejected", "timed_out"):
+            EXECUTOR_EVENTS.set(executor[event], event=event)
+    if models is not None:
+        # 模型被淘汰後不再輸出
+        YOLO_LOAD_SECONDS.clear()
+        for name, entry in models["loaded"].items():
+            YOLO_LOAD_SECONDS.set(entry["load_seconds"], model=name)
+            YOLO_BATCHES.set(sum(b["batches"] for b in entry["batching"]), model=name)
+            YOLO_BATCH_FRAMES.set(sum(b["frames"] for b in entry["batching"]), model=name)
+    if cache is not None:
+        for event in ("hits", "misses", "evictions", "expirations"):
+            CACHE_EVENTS.set(cache[event], event=event)
+        CACHE_BYTES.set(cache["bytes"])
+    if sessions is not None:
+        SESSIONS_ACTIVE.set(sessions["active"])
+    if buffers is not None:
+        BUFFER_POOL_BYTES.set(buffers["idle_bytes"], state="idle")
+        BUFFER_POOL_BYTES.set(buffers["leased_bytes"], state="leased")
+        for event in ("hits", "misses", "evictions"):
+            BUFFER_POOL_EVENTS.set(buffers[event], event=event)
+
+
+class MetricsMiddleware:
+    """ASGI 中介層：記錄 HTTP 請求數、耗時與處理中的請求數
+
+    route 標籤使用路由的路徑樣板，不會因查詢參數或路徑參數產生大量標籤組合。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.inc(-1)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+            HTTP_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=route)
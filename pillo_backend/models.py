@@ -0,0 +1,274 @@
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import profiling
+from batching import BatcherClosedError, MicroBatcher
+from yolo_export import resolve_weights
+
+# 每個模型最多保留幾組不同 (imgsz, conf, iou) 的批次執行緒
+MAX_BATCHERS_PER_MODEL = 8
+
+
+class LazyLoader:
+    """第一次使用時才匯入的類別，例如 ultralytics.YOLO
+
+    匯入 ultralytics 會連帶載入 torch，需要數秒；延後到第一次推論
+    （或啟動後的背景執行緒）才匯入，Otsu / Canny 不必等待。
+    呼叫物件本身等同呼叫匯入的類別；無法匯入時拋出 RuntimeError。
+    """
+
+    def __init__(self, module, name, missing_message):
+        self.module = module
+        self.name = name
+        self.missing_message = missing_message
+        self.error = None
+        self.load_seconds = None
+        self._value = None
+        self._installed = None
+        self._lock = threading.Lock()
+
+    @property
+    def installed(self):
+        """套件是否存在；只查找不匯入"""
+        if self._installed is None:
+            self._installed = importlib.util.find_spec(self.module) is not None
+        return self._installed
+
+    @property
+    def loaded(self):
+        return self._value is not None
+
+    def load(self):
+        """匯入並回傳類別，失敗時回傳 None；多個執行緒同時呼叫只匯入一次"""
+        if self._value is not None or self.error is not None:
+            return self._value
+        with self._lock:
+            if self._value is None and self.error is None:
+                start = time.perf_counter()
+                try:
+                    self._value = getattr(importlib.import_module(self.module), self.name)
+                except Exception as e:
+                    self.error = e
+                self.load_seconds = time.perf_counter() - start
+        return self._value
+
+    def load_in_background(self):
+        """在背景執行緒中匯入，不阻塞呼叫端；套件不存在或已匯入時不做事"""
+        if not self.installed or self.loaded or self.error is not None:
+            return None
+        thread = threading.Thread(target=self._load_and_report, daemon=True,
+                                  name=f"pillo-import-{self.module}")
+        thread.start()
+        return thread
+
+    def _load_and_report(self):
+        if self.load() is not None:
+            print(f"📦 已在背景匯入 {self.module}（{self.load_seconds:.2f}s）")
+        else:
+            print(f"⚠️ 無法匯入 {self.module}: {self.error}")
+
+    def __call__(self, *args, **kwargs):
+        cls = self.load()
+        if cls is None:
+            raise RuntimeError(self.missing_message)
+        return cls(*args, **kwargs)
+
+    def stats(self):
+        return {
+            "installed": self.installed,
+            "loaded": self.loaded,
+            "import_seconds": (round(self.load_seconds, 3)
+                               if self.load_seconds is not None else None),
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+
+def parse_model_specs(text, default_weights):
+    """解析 "nano=yolo11n.pt,final=my_model.pt" 格式，"default" 一定存在"""
+    specs = OrderedDict(default=default_weights)
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, weights = item.partition("=")
+        if not sep or not name.strip() or not weights.strip():
+            raise ValueError(f"無效的模型設定: {item}")
+        specs[name.strip()] = weights.strip()
+    return specs
+
+
+class LoadedModel:
+    """常駐記憶體的單一模型，以及它的推論鎖與動態批次執行緒"""
+
+    def __init__(self, name, model, size_mb, load_seconds, max_batch, max_wait_ms):
+        self.name = name
+        self.model = model
+        self.size_mb = size_mb
+        self.load_seconds = load_seconds
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.last_used = time.time()
+        # 同一個模型在多個工作執行緒間共用，推論需序列化
+        self.lock = threading.Lock()
+        self._batchers = OrderedDict()
+        self._batchers_lock = threading.Lock()
+
+    def predict_batch(self, images, imgsz, conf, iou):
+        """對多張 RGB 影像執行一次批次推論，結果順序與輸入相同"""
+        return self.model.predict(source=images, verbose=False, imgsz=imgsz,
+                                  conf=conf, iou=iou, device='cpu')
+
+    def predict(self, image, imgsz, conf, iou):
+        """單張推論；啟用動態批次時與其他同參數的請求合併
+
+        效能分析中的請求不經過批次執行緒，推論才會出現在 cProfile 報告中。
+        """
+        self.last_used = time.time()
+        if self.max_batch <= 1 or profiling.active():
+            with self.lock:
+                return self.predict_batch([image], imgsz, conf, iou)[0]
+        try:
+            return self._batcher(imgsz, conf, iou).submit(image)
+        except BatcherClosedError:
+            # 模型剛被淘汰，直接單張推論完成這個請求
+            with self.lock:
+                return self.predict_batch([image], imgsz, conf, iou)[0]
+
+    def predict_many(self, images, imgsz, conf, iou):
+        """同一個請求的多張影像（例如切片）直接分批推論，不經過動態批次
+
+        每批最多 max_batch 張，批與批之間釋放推論鎖，讓其他請求可以插隊。
+        """
+        self.last_used = time.time()
+        step = max(self.max_batch, 1)
+        results = []
+        for i in range(0, len(images), step):
+            with self.lock:
+                results.extend(self.predict_batch(images[i:i + step], imgsz, conf, iou))
+        return results
+
+    def _batcher(self, imgsz, conf, iou):
+        key = (imgsz, conf, iou)
+        with self._batchers_lock:
+            batcher = self._batchers.get(key)
+            if batcher is None:
+                def predict_locked(images):
+                    with self.lock:
+                        return self.predict_batch(images, imgsz, conf, iou)
+                batcher = MicroBatcher(
+                    predict_locked,
+                    max_batch_size=self.max_batch,
+                    max_wait_ms=self.max_wait_ms,
+                    name=f"pillo-yolo-batcher-{self.name}")
+                self._batchers[key] = batcher
+                if len(self._batchers) > MAX_BATCHERS_PER_MODEL:
+                    _, oldest = self._batchers.popitem(last=False)
+                    oldest.close()
+            else:
+                self._batchers.move_to_end(key)
+            return batcher
+
+    def close(self):
+        with self._batchers_lock:
+            for batcher in self._batchers.values():
+                batcher.close()
+            self._batchers.clear()
+
+    def stats(self):
+        with self._batchers_lock:
+            batching = [dict(imgsz=k[0], conf=k[1], iou=k[2], **b.stats())
+                        for k, b in self._batchers.items()]
+        return {
+            "size_mb": round(self.size_mb, 1),
+            "load_seconds": round(self.load_seconds, 3),
+            "last_used": self.last_used,
+            "batching": batching,
+        }
+
+
+class ModelRegistry:
+    """多個 YOLO 模型的登錄表
+
+    模型在第一次使用時載入並常駐記憶體；載入後總大小超過
+    memory_budget_mb 時，依最久未使用（LRU）的順序淘汰其他模型。
+    模型大小以權重檔大小估算。
+    """
+
+    def __init__(self, specs, loader, backend="torch", memory_budget_mb=1024.0,
+                 max_batch=1, max_wait_ms=5.0):
+        self.specs = OrderedDict(specs)
+        self.loader = loader
+        self.backend = backend
+        self.memory_budget_mb = memory_budget_mb
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.evictions = 0
+        self._loaded = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def names(self):
+        return list(self.specs)
+
+    def is_loaded(self, name="default"):
+        return name in self._loaded
+
+    def get(self, name="default"):
+        """取得已載入的模型，必要時載入並淘汰最久未使用的模型"""
+        if name not in self.specs:
+            raise ValueError(f"未知的模型: {name}，可用模型: {', '.join(self.specs)}")
+        if self.loader is None:
+            raise RuntimeError("Ultralytics YOLO 未安裝，請安裝 ultralytics 套件")
+
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                return entry
+            loading = self._loading.setdefault(name, threading.Lock())
+
+        # 每個模型各自一把載入鎖，載入大模型時不影響其他模型的請求
+        with loading:
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    return entry
+
+            weights = self.specs[name]
+            start = time.perf_counter()
+            path = resolve_weights(weights, self.backend)
+            model = self.loader(path, task="detect")
+            size_mb = os.path.getsize(weights) / (1024 * 1024) if os.path.exists(weights) else 0.0
+            entry = LoadedModel(name, model, size_mb, time.perf_counter() - start,
+                                self.max_batch, self.max_wait_ms)
+
+            with self._lock:
+                self._loaded[name] = entry
+                self._evict(keep=name)
+            return entry
+
+    def _evict(self, keep):
+        # 至少保留剛載入的模型，即使它本身就超出預算
+        while self._resident_mb() > self.memory_budget_mb and len(self._loaded) > 1:
+            oldest = next(n for n in self._loaded if n != keep)
+            self._loaded.pop(oldest).close()
+            self.evictions += 1
+
+    def _resident_mb(self):
+        return sum(entry.size_mb for entry in self._loaded.values())
+
+    def stats(self):
+        with self._lock:
+            loaded = {name: entry.stats() for name, entry in self._loaded.items()}
+        return {
+            "backend": self.backend,
+            "available": self.names(),
+            "loaded": loaded,
+            "resident_mb": round(sum(e["size_mb"] for e in loaded.values()), 1),
+            "memory_budget_mb": self.memory_budget_mb,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,139 @@
+import copy
+import threading
+import time
+
+import numpy as np
+
+# 已註冊的處理階段：名稱 -> 函式 fn(ctx, value, **params)
+STAGES = {}
+# 已註冊的算法：名稱 -> Pipeline
+ALGORITHMS = {}
+# 未指定算法時使用的預設算法
+DEFAULT_ALGORITHM = "algorithm2"
+
+
+def register_stage(name):
+    """註冊處理階段，函式收到前一階段的輸出並回傳這一階段的輸出"""
+    def decorator(fn):
+        STAGES[name] = fn
+        return fn
+    return decorator
+
+
+def register_algorithm(pipeline):
+    ALGORITHMS[pipeline.name] = pipeline
+    return pipeline
+
+
+def get_algorithm(name):
+    if name is None:
+        name = DEFAULT_ALGORITHM
+    pipeline = ALGORITHMS.get(name)
+    if pipeline is None:
+        raise ValueError(f"未知的算法: {name}，可用算法: {', '.join(ALGORITHMS)}")
+    return pipeline
+
+
+def _freeze(params):
+    return tuple(sorted((k, repr(v)) for k, v in params.items()))
+
+
+class PipelineResult:
+    """算法的最終輸出：數量與輪廓或偵測框"""
+
+    def __init__(self, count, contours=None, boxes=None):
+        self.count = count
+        self.contours = contours
+        self.boxes = boxes
+        # 這次執行各階段的耗時（毫秒），沿用共用結果的階段不列入
+        self.timings = {}
+        # 直接沿用其他算法已算好結果的階段
+        self.reused = []
+
+
+class FrameContext:
+    """單一影格的處理狀態
+
+    同一張影格可依序執行多個算法；各階段的輸出以「到該階段為止的
+    階段與參數」為鍵快取，前綴相同（例如灰階 + 高斯模糊）的算法
+    只會計算一次；多個算法平行執行時，後到的會等待先到的算完再沿用。
+    display_frame 不為 None 時 annotate 階段才會繪製。frame 是裁切或縮小後的
+    區域時，scale / offset 用來把座標換算回 display_frame：
+    原始座標 = 區域座標 * scale + offset。buffers 為 BufferPool 借出的
+    FrameBuffers，各階段以 buffer() 取得重複使用的輸出陣列。
+    """
+
+    def __init__(self, frame, options=None, models=None, display_frame=None, scale=1.0,
+                 offset=(0, 0), buffers=None):
+        self.frame = frame
+        self.options = options or {}
+        self.models = models
+        self.display_frame = display_frame
+        self.scale = scale
+        self.offset = offset
+        self.buffers = buffers
+        self.cache = {}
+        # 各階段累計耗時（毫秒）
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def buffer(self, shape, dtype=np.uint8):
+        """階段輸出用的陣列，作為 OpenCV 的 dst；沒有緩衝池時回傳 None，由 OpenCV 配置"""
+        if self.buffers is None:
+            return None
+        return self.buffers.get(shape, dtype)
+
+    def add_timing(self, stage, elapsed):
+        with self._lock:
+            self.timings[stage] = round(self.timings.get(stage, 0.0) + elapsed, 3)
+
+
+class Pipeline:
+    """由已註冊階段組成的算法，例如灰階 -> 模糊 -> 二值化 -> 輪廓 -> 計數 -> 標註"""
+
+    def __init__(self, name, stages, description=""):
+        for stage, _ in stages:
+            if stage not in STAGES:
+                raise ValueError(f"未註冊的處理階段: {stage}")
+        self.name = name
+        self.stages = [(stage, dict(params)) for stage, params in stages]
+        self.description = description
+
+    def run(self, ctx):
+        value = ctx.frame
+        key = ()
+        timings = {}
+        reused = []
+        for stage, params in self.stages:
+            key = key + ((stage, _freeze(params)),)
+            with ctx.key_lock(key):
+                if key in ctx.cache:
+                    value = ctx.cache[key]
+                    reused.append(stage)
+                    continue
+                start = time.perf_counter()
+                value = STAGES[stage](ctx, value, **params)
+                elapsed = (time.perf_counter() - start) * 1000.0
+                ctx.cache[key] = value
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 3)
+            ctx.add_timing(stage, elapsed)
+
+        if not isinstance(value, PipelineResult):
+            raise ValueError(f"算法 {self.name} 沒有以 count 階段結束")
+        # 最後一個階段的輸出可能是與其他算法共用的快取結果，耗時記錄在各自的淺拷貝上
+        value = copy.copy(value)
+        value.timings = timings
+        value.reused = reused
+        return value
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "description": self.description,
+            "stages": [{"stage": stage, **params} for stage, params in self.stages],
+        }
@@ -0,0 +1,297 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import base64
+import config
+import profiling
+import algorithms  # noqa: F401  註冊內建算法
+from buffers import BufferPool
+from models import LazyLoader, ModelRegistry, parse_model_specs
+from pipeline import ALGORITHMS, FrameContext, get_algorithm
+from roi import decode_view, view_frame
+from stages import bounding_boxes, contours_to_lists, detections_to_lists, map_result, yolo_params
+
+# ultralytics（連同 torch）在第一次載入模型時才匯入
+YOLO = LazyLoader("ultralytics", "YOLO", "Ultralytics YOLO 未安裝，請安裝 ultralytics 套件")
+
+# 每個請求可選的輸出模式
+OUTPUT_MODES = ("count", "geometry", "image")
+
+
+def _lap(timings, stage, start):
+    """記錄 stage 耗時（毫秒）並回傳新的起點"""
+    now = time.perf_counter()
+    timings[stage] = round((now - start) * 1000.0, 3)
+    return now
+
+
+def decode_base64(image_data):
+    """解碼 base64 影像，可接受 data URL 或純 base64 字串"""
+    return base64.b64decode(image_data.split(',')[1] if ',' in image_data else image_data)
+
+
+class ImageProcessor:
+    def __init__(self, yolo_max_batch=None, yolo_max_wait_ms=None, yolo_models=None,
+                 yolo_backend=None, buffer_pool_mb=None):
+        self.algorithm = "algorithm2"
+        # 可同時常駐多個 YOLO 模型，由各請求自行選擇
+        self.models = ModelRegistry(
+            yolo_models or parse_model_specs(config.YOLO_MODELS, config.YOLO_WEIGHTS),
+            loader=YOLO,
+            # torch 直接載入 .pt；onnx / openvino 使用匯出後的 CPU 推論模型
+            backend=yolo_backend or config.YOLO_BACKEND,
+            memory_budget_mb=config.YOLO_MEMORY_BUDGET_MB,
+            # 同時進來的 YOLO 請求合併成批次推論，批次上限為 1 時停用
+            max_batch=yolo_max_batch or config.YOLO_MAX_BATCH,
+            max_wait_ms=yolo_max_wait_ms if yolo_max_wait_ms is not None
+            else config.YOLO_MAX_WAIT_MS,
+        )
+        # 依影格尺寸重複使用的中間結果陣列，穩定後每張影格不必重新配置
+        pool_mb = config.BUFFER_POOL_MB if buffer_pool_mb is None else buffer_pool_mb
+        self.buffers = BufferPool(int(pool_mb * 1024 * 1024))
+        # 比較多個算法時平行執行用的執行緒池，第一次比較時才建立
+        self._compare_pool = None
+        self._compare_lock = threading.Lock()
+
+    def _compare_executor(self):
+        """同時進來的多個比較請求只建立一個執行緒池"""
+        with self._compare_lock:
+            if self._compare_pool is None:
+                self._compare_pool = ThreadPoolExecutor(
+                    max_workers=len(ALGORITHMS), thread_name_prefix="pillo-compare")
+            return self._compare_pool
+
+    def ensure_yolo_loaded(self, name="default"):
+        return self.models.get(name)
+
+    def warmup_yolo(self, runs=None):
+        """預先載入預設模型並以 640 輸入尺寸推論數次，讓第一個請求不用等待
+
+        失敗時只印出警告，Otsu / Canny 仍可正常服務。
+        """
+        runs = config.YOLO_WARMUP_RUNS if runs is None else runs
+        try:
+            entry = self.ensure_yolo_loaded()
+            dummy = np.zeros((640, 640, 3), np.uint8)
+            start = time.perf_counter()
+            with entry.lock:
+                for _ in range(runs):
+                    entry.predict_batch([dummy], **yolo_params(None))
+            print(f"🔥 YOLO 預熱完成（{self.models.backend}，載入 {entry.load_seconds:.2f}s，"
+                  f"預熱 {runs} 次 {time.perf_counter() - start:.2f}s）")
+        except Exception as e:
+            print(f"⚠️ YOLO 預載失敗: {e}")
+
+    def process_image(self, image_data: str, algorithm: str = None, output: str = "image",
+                      options: dict = None):
+        """處理 base64 影像並回傳結果"""
+        try:
+            image_bytes = decode_base64(image_data)
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "count": 0
+            }
+        return self.process_bytes(image_bytes, algorithm, output=output, options=options)
+
+    def process_bytes(self, image_bytes, algorithm: str = None, image_format: str = "base64",
+                      output: str = "image", options: dict = None):
+        """處理原始影像位元組並回傳結果
+
+        output 決定回傳內容：
+        - "count": 只回傳數量，不繪製也不編碼
+        - "geometry": 另外回傳輪廓或偵測框座標
+        - "image": 回傳標註後的影像；image_format 為 "base64" 時回傳
+          data URL，為 "jpeg" 時以 processed_jpeg 回傳編碼後的位元組
+
+        options 為各請求的參數，yolo11 可指定 model / imgsz / conf / iou；
+        roi [x, y, w, h] 與 max_side 讓算法只處理裁切、縮小後的區域，回傳的
+        座標一律換算回原始影像；track 為 True 時另外以 bboxes 回傳 (N, 4)
+        外接框陣列供追蹤使用。
+        """
+        try:
+            if output not in OUTPUT_MODES:
+                raise ValueError(f"不支援的輸出模式: {output}")
+
+            timings = {}
+            start = time.perf_counter()
+            with self.buffers.lease() as buffers:
+                # 要輸出標註影像時以原解析度解碼，否則可直接以較低解析度解碼
+                view = decode_view(image_bytes, options, full_resolution=output == "image",
+                                   buffers=buffers)
+                _lap(timings, "decode", start)
+                return self._process_view(view, algorithm, image_format, output, options,
+                                          timings, buffers)
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "count": 0
+            }
+
+    def process_array(self, frame, algorithm: str = None, image_format: str = "jpeg",
+                      output: str = "image", options: dict = None):
+        """處理已解碼的 BGR 影格（例如伺服器端攝影機），參數與回傳值同 process_bytes
+
+        output 為 "image" 時標註直接畫在 frame 上。
+        """
+        try:
+            if output not in OUTPUT_MODES:
+                raise ValueError(f"不支援的輸出模式: {output}")
+
+            timings = {}
+            start = time.perf_counter()
+            with self.buffers.lease() as buffers:
+                view = view_frame(frame, options, buffers)
+                if view.image is not frame:
+                    _lap(timings, "resize", start)
+                return self._process_view(view, algorithm, image_format, output, options,
+                                          timings, buffers)
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "count": 0
+            }
+
+    def _process_view(self, view, algorithm, image_format, output, options, timings,
+                      buffers=None):
+        """在 view 上執行算法並依 output 組出結果；錯誤由呼叫端轉成失敗結果
+
+        中間結果寫在 buffers 借來的陣列中，回傳的結果不引用它們。
+        """
+        frame = view.frame
+        pipeline = get_algorithm(algorithm)
+        # 偵測完成後原始影像不再使用，標註直接畫在上面
+        ctx = FrameContext(view.image, options, models=self.models,
+                           display_frame=frame if output == "image" else None,
+                           scale=view.scale, offset=view.offset, buffers=buffers)
+        detection = pipeline.run(ctx)
+        timings.update(ctx.timings)
+        start = time.perf_counter()
+        if output == "geometry" or (options and options.get("track")):
+            detection = map_result(detection, view.scale, view.offset)
+
+        result = {
+            "success": True,
+            "count": detection.count,
+            "algorithm": algorithm
+        }
+        if output == "geometry":
+            if detection.boxes is not None:
+                result["boxes"] = detections_to_lists(detection.boxes)
+            else:
+                result["contours"] = contours_to_lists(detection.contours)
+        if options and options.get("track"):
+            result["bboxes"] = bounding_boxes(detection)
+        if output == "image":
+            if view.roi is not None:
+                x, y, w, h = view.roi
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
+            # 編碼處理後的影像
+            ret, buffer = cv2.imencode('.jpg', frame, [
+                                       cv2.IMWRITE_JPEG_QUALITY, 80])
+            if not ret:
+                raise ValueError("無法編碼處理後的影像")
+            start = _lap(timings, "encode", start)
+            if image_format == "jpeg":
+                result["processed_jpeg"] = buffer.tobytes()
+            else:
+                processed_image = base64.b64encode(buffer).decode('utf-8')
+                result["processed_image"] = f"data:image/jpeg;base64,{processed_image}"
+                _lap(timings, "base64", start)
+        result["timings"] = timings
+        return result
+
+    def profile_bytes(self, image_bytes, algorithm: str = None, image_format: str = "base64",
+                      output: str = "image", options: dict = None):
+        """與 process_bytes 相同，但以 cProfile 執行並在 profile 附上耗時最高的函式"""
+        result, report = profiling.profile_call(self.process_bytes, image_bytes, algorithm,
+                                                image_format, output, options)
+        result["profile"] = report
+        return result
+
+    def compare_bytes(self, image_bytes, algorithms, output: str = "count", options: dict = None):
+        """只解碼一次，在同一張影格上平行執行多個算法並回傳各自的數量與耗時
+
+        灰階、模糊等相同前綴的階段在算法之間共用。output 可為
+        "count" 或 "geometry"；roi / max_side 的意義與 process_bytes 相同。
+        """
+        try:
+            if output not in ("count", "geometry"):
+                raise ValueError(f"比較模式不支援的輸出模式: {output}")
+            algorithms = list(dict.fromkeys(algorithms or []))
+            if not algorithms:
+                raise ValueError("至少需要指定一個算法")
+            pipelines = [get_algorithm(name) for name in algorithms]
+
+            timings = {}
+            start = time.perf_counter()
+            with self.buffers.lease() as buffers:
+                view = decode_view(image_bytes, options, buffers=buffers)
+                start = _lap(timings, "decode", start)
+
+                ctx = FrameContext(view.image, options, models=self.models, buffers=buffers)
+                if profiling.active():
+                    # cProfile 只看得到目前執行緒，分析時依序執行
+                    outcomes = [_run_timed(pipeline, ctx) for pipeline in pipelines]
+                else:
+                    futures = [self._compare_executor().submit(_run_timed, pipeline, ctx)
+                               for pipeline in pipelines]
+                    # 所有算法都結束後才歸還陣列
+                    outcomes = [future.result() for future in futures]
+
+            results = {}
+            for name, (detection, latency, error) in zip(algorithms, outcomes):
+                if error is not None:
+                    results[name] = {"success": False, "error": str(error),
+                                     "error_type": type(error).__name__, "count": 0,
+                                     "latency_ms": latency}
+                    continue
+                entry = {
+                    "success": True,
+                    "count": detection.count,
+                    "latency_ms": latency,
+                    "timings": detection.timings,
+                    "reused": detection.reused,
+                }
+                if output == "geometry":
+                    detection = map_result(detection, view.scale, view.offset)
+                    if detection.boxes is not None:
+                        entry["boxes"] = detections_to_lists(detection.boxes)
+                    else:
+                        entry["contours"] = contours_to_lists(detection.contours)
+                results[name] = entry
+            _lap(timings, "detect", start)
+
+            return {
+                "success": True,
+                "results": results,
+                "timings": timings,
+            }
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "results": {}
+            }
+
+
+def _run_timed(pipeline, ctx):
+    """執行單一算法，回傳 (結果, 耗時毫秒, 例外)"""
+    start = time.perf_counter()
+    try:
+        detection = pipeline.run(ctx)
+        error = None
+    except Exception as e:
+        detection, error = None, e
+    return detection, round((time.perf_counter() - start) * 1000.0, 3), error
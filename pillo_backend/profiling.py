@@ -0,0 +1,119 @@
+"""線上效能分析：單一請求的 cProfile 與整個行程的堆疊取樣
+
+兩者都只在 PILLO_PROFILING=1 時由 main.py 開放；未開啟時這個模組的
+程式碼不會被呼叫，請求路徑上沒有額外負擔。
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+# 同一個行程一次只能有一個 cProfile（Python 3.12 起第二個會直接失敗）
+_profile_lock = threading.Lock()
+# 同一時間只進行一次取樣
+_sample_lock = threading.Lock()
+# 目前執行緒是否正在 profile_call 中；cProfile 只看得到呼叫端執行緒
+_local = threading.local()
+
+# 葉節點落在這些檔案中的堆疊視為閒置執行緒（等待鎖、佇列或 I/O）
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py")
+
+
+def _function_name(filename, line, name):
+    if filename == "~":
+        # 內建函式，例如 <built-in method cv2.Canny>
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def active():
+    """目前執行緒是否正在分析；是的話 YOLO 動態批次與比較用的執行緒池改在原執行緒執行"""
+    return getattr(_local, "active", False)
+
+
+def profile_call(fn, *args, limit=30, **kwargs):
+    """以 cProfile 執行 fn，回傳 (fn 的回傳值, 報告)
+
+    報告列出累計耗時最高的 limit 個函式。cProfile 只記錄呼叫端執行緒，
+    分析期間 active() 為真，原本交給其他執行緒的推論與比較都改在這個
+    執行緒中執行，才會出現在報告裡。已有其他請求正在分析時不等待，
+    照常執行 fn 並在報告中註明。
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return fn(*args, **kwargs), {"error": "另一個請求正在進行效能分析"}
+    try:
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        _local.active = True
+        profiler.enable()
+        try:
+            value = fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            _local.active = False
+        wall_ms = (time.perf_counter() - start) * 1000.0
+    finally:
+        _profile_lock.release()
+
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return value, {
+        "wall_ms": round(wall_ms, 3),
+        "functions": [
+            {
+                "function": _function_name(*func),
+                "calls": calls,
+                "total_ms": round(total * 1000.0, 3),
+                "cumulative_ms": round(cumulative * 1000.0, 3),
+            }
+            for func, (_, calls, total, cumulative, _) in rows
+        ],
+    }
+
+
+def _collapse(frame, thread_name):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                     f"{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+def _is_idle(frame):
+    return os.path.basename(frame.f_code.co_filename) in IDLE_FILES
+
+
+def sample_stacks(seconds, interval=0.005, include_idle=False):
+    """每隔 interval 秒取樣所有執行緒的堆疊，持續 seconds 秒
+
+    回傳 collapsed stack 格式（每行「執行緒;外層函式;...;內層函式 次數」），
+    可直接交給 flamegraph.pl 或 speedscope。只涵蓋目前行程，
+    process 執行模式下工作者行程中的處理不會出現。
+    """
+    if not _sample_lock.acquire(blocking=False):
+        raise RuntimeError("已有取樣正在進行")
+    try:
+        me = threading.get_ident()
+        counts = {}
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not include_idle and _is_idle(frame)):
+                    continue
+                key = _collapse(frame, names.get(ident, f"thread-{ident}"))
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _sample_lock.release()
+
+    lines = [f"{stack} {count}" for stack, count in
+             sorted(counts.items(), key=lambda item: item[1], reverse=True)]
+    return "\n".join(lines) + "\n", samples
@@ -0,0 +1,174 @@
+import struct
+
+import cv2
+import numpy as np
+
+# 依縮小倍數選用的解碼旗標，JPEG 解碼器可直接以 1/2、1/4、1/8 解析度解碼
+_REDUCED_COLOR = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                  (2, cv2.IMREAD_REDUCED_COLOR_2))
+# JPEG 中帶有影像尺寸的 SOF 區段標記
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+# EXIF 方向 5～8 表示影像需要轉 90 度，cv2.imdecode 解碼後寬高會互換
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _exif_orientation(segment):
+    """從 APP1 區段內容讀取 EXIF 方向（1～8），沒有時回傳 1"""
+    if len(segment) < 14 or bytes(segment[:6]) != b"Exif\0\0":
+        return 1
+    tiff = segment[6:]
+    order = {b"II": "<", b"MM": ">"}.get(bytes(tiff[:2]))
+    if order is None:
+        return 1
+    try:
+        ifd = struct.unpack(order + "I", tiff[4:8])[0]
+        count = struct.unpack(order + "H", tiff[ifd:ifd + 2])[0]
+        for k in range(count):
+            entry = ifd + 2 + 12 * k
+            tag, kind = struct.unpack(order + "HH", tiff[entry:entry + 4])
+            if tag == 0x0112 and kind == 3:
+                return struct.unpack(order + "H", tiff[entry + 8:entry + 10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def jpeg_size(image_bytes):
+    """只讀 JPEG 標頭取得解碼後的 (寬, 高)，不是 JPEG 或標頭不完整時回傳 None
+
+    套用 EXIF 方向：cv2.imdecode 會依方向旋轉影像，回傳的尺寸與解碼結果一致。
+    """
+    data = memoryview(image_bytes)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    orientation = 1
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker == 0xE1 and orientation == 1:
+            orientation = _exif_orientation(data[i + 4:i + 2 + length])
+        if marker in _SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            if orientation in _TRANSPOSED_ORIENTATIONS:
+                return height, width
+            return width, height
+        i += 2 + length
+    return None
+
+
+def view_params(options):
+    """取出並檢查 roi [x, y, w, h] 與 max_side，未指定時為 None"""
+    options = options or {}
+    roi = options.get("roi")
+    if roi is not None:
+        if len(roi) != 4:
+            raise ValueError("roi 必須是 [x, y, w, h]")
+        roi = tuple(int(v) for v in roi)
+        if roi[0] < 0 or roi[1] < 0 or roi[2] <= 0 or roi[3] <= 0:
+            raise ValueError(f"roi 座標不可為負且寬高必須大於 0: {list(roi)}")
+    max_side = options.get("max_side")
+    if max_side is not None:
+        max_side = int(max_side)
+        if not 32 <= max_side <= 8192:
+            raise ValueError(f"max_side 必須介於 32 與 8192 之間: {max_side}")
+    return roi, max_side
+
+
+def _reduced_factor(image_bytes, roi, max_side):
+    """在處理區域縮小後仍不小於 max_side 的前提下，選擇最大的解碼縮小倍數"""
+    size = jpeg_size(image_bytes)
+    if size is None:
+        return 1
+    width, height = size
+    if roi is not None:
+        width, height = min(roi[2], width), min(roi[3], height)
+    long_side = max(width, height)
+    for factor, _ in _REDUCED_COLOR:
+        if long_side // factor >= max_side:
+            return factor
+    return 1
+
+
+class FrameView:
+    """實際送進算法的影像區域，以及換算回原始影像座標的比例與位移
+
+    原始座標 = 區域座標 * scale + offset
+    """
+
+    def __init__(self, frame, image, scale=1.0, offset=(0, 0), roi=None):
+        # 解碼後的整張影像（可能已經以較低解析度解碼）
+        self.frame = frame
+        self.image = image
+        self.scale = scale
+        self.offset = offset
+        # 裁切範圍（原始影像座標），沒有裁切時為 None
+        self.roi = roi
+
+
+def decode_view(image_bytes, options=None, full_resolution=False, buffers=None):
+    """解碼影像並依 roi / max_side 裁切、縮小成算法要處理的區域
+
+    full_resolution 為 True 時（需要在原始影像上標註）一律以原解析度解碼，
+    只在裁切後的區域上縮小；否則 JPEG 會直接以 IMREAD_REDUCED_* 降低解析度解碼。
+    buffers 為 FrameBuffers 時，縮小後的區域寫入借來的陣列。
+    """
+    roi, max_side = view_params(options)
+    factor = 1
+    flag = cv2.IMREAD_COLOR
+    if max_side is not None and not full_resolution:
+        factor = _reduced_factor(image_bytes, roi, max_side)
+        flag = dict(_REDUCED_COLOR).get(factor, cv2.IMREAD_COLOR)
+
+    # 直接以請求緩衝區建立陣列並解碼，不另外複製
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    if frame is None:
+        raise ValueError("無法解碼影像")
+    return _crop_view(frame, roi, max_side, factor, buffers)
+
+
+def view_frame(frame, options=None, buffers=None):
+    """已解碼的影像（例如攝影機影格）依 roi / max_side 裁切、縮小成算法要處理的區域"""
+    roi, max_side = view_params(options)
+    return _crop_view(frame, roi, max_side, buffers=buffers)
+
+
+def _crop_view(frame, roi, max_side, factor=1, buffers=None):
+    """frame 是以 1/factor 解析度解碼的影像；roi 為原始影像座標"""
+    if roi is None and max_side is None:
+        return FrameView(frame, frame)
+
+    image = frame
+    offset = (0, 0)
+    if roi is not None:
+        height, width = frame.shape[:2]
+        x0, y0 = min(roi[0] // factor, width), min(roi[1] // factor, height)
+        x1 = min(-(-(roi[0] + roi[2]) // factor), width)
+        y1 = min(-(-(roi[1] + roi[3]) // factor), height)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"roi 超出影像範圍: {list(roi)}")
+        image = frame[y0:y1, x0:x1]
+        offset = (x0 * factor, y0 * factor)
+        roi = (offset[0], offset[1], (x1 - x0) * factor, (y1 - y0) * factor)
+
+    scale = float(factor)
+    if max_side is not None and max(image.shape[:2]) > max_side:
+        ratio = max_side / max(image.shape[:2])
+        height, width = image.shape[:2]
+        size = (max(1, int(width * ratio + 0.5)), max(1, int(height * ratio + 0.5)))
+        dst = buffers.get((size[1], size[0]) + image.shape[2:]) if buffers is not None else None
+        image = cv2.resize(image, size, dst=dst, interpolation=cv2.INTER_AREA)
+        scale = factor / ratio
+    return FrameView(frame, image, scale, offset, roi)
@@ -0,0 +1,226 @@
+"""正式環境的多工作者服務：監督行程預先載入模型，再 fork 出工作者
+
+    python serve.py                              # 工作者數依可用 CPU 決定
+    python serve.py --workers 4 --port 8000
+    python serve.py --no-preload                 # 不預載 YOLO 權重，第一次使用時各自載入
+
+監督行程先匯入 main，載入並預熱預設的 YOLO 模型，以 gc.freeze() 把目前所有
+物件移出垃圾回收的追蹤範圍（避免回收時寫入物件標頭而複製記憶體分頁），
+接著建立監聽 socket 並 fork 出工作者。工作者以寫入時複製（copy-on-write）
+共用已載入的權重，不必各自載入與預熱；核心在共用的 socket 上把新連線
+分給各工作者。工作者異常結束時，監督行程會重新 fork 一個。
+
+結果快取、攝影機會話與 /metrics 的指標都在各工作者中各自保存。
+只支援有 fork 的平台（Linux / macOS），其他平台退回單一行程的 uvicorn。
+"""
+import argparse
+import gc
+import math
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+import cv2
+import uvicorn
+
+import config
+
+# 工作者啟動後這麼多秒內就結束，視為啟動失敗，重新 fork 前先等待
+CRASH_BACKOFF_SECONDS = 5.0
+# 收到 SIGTERM 後等待工作者優雅結束的秒數，逾時則強制結束
+SHUTDOWN_TIMEOUT = 30.0
+
+
+def _cgroup_cpu_quota():
+    """容器以 --cpus 限制的 CPU 配額（cgroup v2 或 v1），未限制時回傳 None"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+    """實際可用的 CPU 數：考慮 CPU 親和性與容器的 CPU 配額"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def set_compute_threads(n):
+    """限制 OpenCV 與 torch 的運算執行緒數，避免多個工作者互相搶 CPU"""
+    cv2.setNumThreads(n)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(n)
+
+
+def preload(threads, warmup=True):
+    """在監督行程中匯入應用程式並預熱模型，回傳 FastAPI app
+
+    fork 之前不能有其他執行緒或事件迴圈；預熱期間只用一個運算執行緒，
+    避免 OpenMP 執行緒池在 fork 後的子行程中卡住。
+    """
+    config.EXECUTOR_MODE = "thread"
+    if "PILLO_WORKERS" not in os.environ:
+        config.EXECUTOR_WORKERS = threads
+
+    import main
+    # ultralytics 與 torch 也在 fork 前匯入，工作者共用已匯入的模組，不必各自在背景匯入
+    main.YOLO.load()
+    # torch 要匯入之後才能限制執行緒數，必須在預熱建立執行緒池之前設定
+    set_compute_threads(1)
+    if warmup:
+        main.processor.warmup_yolo()
+    # 工作者共用已預熱的模型，lifespan 中不必再預熱一次
+    config.YOLO_PRELOAD = False
+
+    if threading.active_count() > 1:
+        names = ", ".join(t.name for t in threading.enumerate()
+                          if t is not threading.current_thread())
+        print(f"⚠️ fork 前仍有執行緒在執行，工作者中可能無法使用: {names}")
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+class Supervisor:
+    """fork 並看管共用同一個監聽 socket 的 uvicorn 工作者"""
+
+    def __init__(self, uvicorn_config, workers, threads):
+        self.config = uvicorn_config
+        self.workers = workers
+        self.threads = threads
+        self.socket = uvicorn_config.bind_socket()
+        self.children = {}
+        self.stopping = False
+        self.deadline = None
+
+    def spawn(self):
+        # 先清空緩衝區，子行程才不會重複輸出監督行程尚未寫出的內容
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self.children[pid] = time.monotonic()
+        return pid
+
+    def _run_worker(self):
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            set_compute_threads(self.threads)
+            uvicorn.Server(self.config).run(sockets=[self.socket])
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            # 不執行監督行程留下的 atexit 與緩衝區清理
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _terminate(self, signum, _frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        self.deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        # Ctrl+C 的 SIGINT 已送給整個行程群組，再轉送會讓 uvicorn 跳過優雅關閉
+        if signum == signal.SIGTERM:
+            for pid in self.children:
+                self._kill(pid, signal.SIGTERM)
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._terminate)
+        signal.signal(signal.SIGINT, self._terminate)
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"🚀 已啟動 {self.workers} 個工作者（每個 {self.threads} 個處理執行緒）: "
+              f"{', '.join(map(str, self.children))}")
+
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if self.deadline is not None and time.monotonic() > self.deadline:
+                    print("⚠️ 工作者未在時限內結束，強制終止")
+                    for child in self.children:
+                        self._kill(child, signal.SIGKILL)
+                    self.deadline = None
+                time.sleep(0.2)
+                continue
+
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            print(f"⚠️ 工作者 {pid} 意外結束（狀態 {status}），重新啟動")
+            if time.monotonic() - started < CRASH_BACKOFF_SECONDS:
+                time.sleep(1.0)
+            self.spawn()
+        self.socket.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-w", "--workers", type=int, default=config.SERVE_WORKERS,
+                        help="工作者行程數，0 表示依可用 CPU 數決定")
+    parser.add_argument("--no-preload", action="store_true", help="不在監督行程中預載 YOLO")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    cpus = available_cpus()
+    workers = args.workers or cpus
+    if config.CAMERAS and workers > 1:
+        # 同一台攝影機只能由一個行程開啟，擷取與偵測也不應在每個工作者中各跑一份
+        print("⚠️ 已設定 PILLO_CAMERAS，serve.py 改以單一工作者服務")
+        workers = 1
+    # 每個工作者分到的 CPU 數，同時作為處理執行緒數與 OpenCV / torch 執行緒數
+    threads = max(1, cpus // workers)
+    if config.EXECUTOR_MODE == "process":
+        print("⚠️ serve.py 以多個工作者行程服務，PILLO_EXECUTOR=process 改用 thread")
+
+    app = preload(threads, warmup=not args.no_preload)
+    uvicorn_config = uvicorn.Config(app, host=args.host, port=args.port,
+                                    log_level=args.log_level)
+    if not hasattr(os, "fork"):
+        print("⚠️ 此平台不支援 fork，以單一行程服務")
+        uvicorn.Server(uvicorn_config).run()
+        return 0
+    Supervisor(uvicorn_config, workers, threads).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
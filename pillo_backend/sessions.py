@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# 變化偵測用的縮圖尺寸
+THUMBNAIL_SIZE = (64, 48)
+# 追蹤的數量穩定後，畫面靜止時可沿用結果的時間延長為幾倍
+STABLE_STALE_FACTOR = 3
+# 只描述單次回應來源的欄位，存成沿用的基準前先移除
+RESPONSE_FLAGS = ("cached", "stale", "stale_since", "motion")
+
+
+def motion_thumbnail(image_bytes):
+    """以 1/8 解析度直接解碼成灰階，再縮成固定大小的縮圖；無法解碼時回傳 None"""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    small = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    thumb = cv2.resize(small, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    # 輕微模糊壓掉感光雜訊，避免靜止畫面被誤判為變化
+    return cv2.GaussianBlur(thumb, (3, 3), 0)
+
+
+class MotionGate:
+    """比較新影格與上次實際處理影格的縮圖，判斷畫面是否有變化
+
+    差異超過 pixel_delta 灰階的像素比例大於 changed_ratio 時視為變化；
+    距離上次處理超過 max_stale 秒時也會強制重新處理，以免慢慢累積的
+    變化一直被忽略。
+    """
+
+    def __init__(self, pixel_delta=20, changed_ratio=0.01, max_stale=10.0):
+        self.pixel_delta = pixel_delta
+        self.changed_ratio = changed_ratio
+        self.max_stale = max_stale
+
+    def motion(self, reference, thumb):
+        """回傳變化像素比例"""
+        diff = cv2.absdiff(reference, thumb)
+        return float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+
+    def changed(self, reference, thumb, processed_at, now=None, max_stale=None):
+        """回傳 (是否需要重新處理, 變化比例)"""
+        if reference is None or thumb is None or reference.shape != thumb.shape:
+            return True, 1.0
+        motion = self.motion(reference, thumb)
+        now = time.time() if now is None else now
+        if now - processed_at >= (self.max_stale if max_stale is None else max_stale):
+            return True, motion
+        return motion > self.changed_ratio, motion
+
+
+class Session:
+    """單一用戶端（例如一支手機攝影機）跨請求保留的狀態"""
+
+    def __init__(self, session_id, gate, tracker_factory=None):
+        self.id = session_id
+        self.gate = gate
+        self._tracker_factory = tracker_factory
+        # 第一次要求追蹤時才建立
+        self.tracker = None
+        self._tracker_key = None
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.frames = 0
+        self.gated = 0
+        self._reference = None
+        self._result = None
+        self._request_key = None
+        self._processed_at = 0.0
+
+    def get_tracker(self, key=None):
+        """回傳這個會話的追蹤器；key（算法與參數）與上次不同時重新建立
+
+        換了算法、模型或參數後，偵測框的來源與座標不再可比，沿用舊的軌跡
+        會把不相干的框配對起來，數量也會跨越切換被平滑。
+        """
+        if self.tracker is None or key != self._tracker_key:
+            self.tracker = self._tracker_factory()
+            self._tracker_key = key
+        return self.tracker
+
+    def reuse(self, thumb, request_key):
+        """畫面沒有變化且參數相同時回傳上次結果的複本，否則回傳 None"""
+        self.last_seen = time.time()
+        self.frames += 1
+        if self._result is None or request_key != self._request_key:
+            return None, 1.0
+        max_stale = None
+        if self.tracker is not None and self.tracker.stable:
+            max_stale = self.gate.max_stale * STABLE_STALE_FACTOR
+        changed, motion = self.gate.changed(self._reference, thumb, self._processed_at,
+                                            max_stale=max_stale)
+        if changed:
+            return None, motion
+        self.gated += 1
+        result = dict(self._result)
+        result.update(stale=True, stale_since=self._processed_at, motion=round(motion, 4))
+        return result, motion
+
+    def update(self, thumb, request_key, result):
+        """記錄剛處理完的影格，作為之後比較的基準"""
+        if not result.get("success") or thumb is None:
+            return
+        self._reference = thumb
+        self._request_key = request_key
+        self._processed_at = time.time()
+        # 從結果快取取得的結果帶有 cached，沿用時應只標示 stale
+        self._result = {k: v for k, v in result.items() if k not in RESPONSE_FLAGS}
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "gated": self.gated,
+            "last_seen": self.last_seen,
+            "tracking": self.tracker is not None,
+        }
+
+
+class SessionStore:
+    """依 session id 保存 Session，閒置超過 ttl 秒或數量超過上限時淘汰最舊的"""
+
+    def __init__(self, gate, tracker_factory=None, ttl=300.0, max_sessions=1000):
+        self.gate = gate
+        self.tracker_factory = tracker_factory
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.gate, self.tracker_factory)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def _expire(self, now):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        frames = sum(s.frames for s in sessions)
+        gated = sum(s.gated for s in sessions)
+        return {
+            "active": len(sessions),
+            "frames": frames,
+            "gated": gated,
+            "gate_rate": round(gated / frames, 4) if frames else 0.0,
+        }
@@ -0,0 +1,384 @@
+import cv2
+import numpy as np
+
+from pipeline import PipelineResult, register_stage
+from tiling import merge_tiles, plan_tiles, tile_params
+
+# YOLO 推論參數預設值
+YOLO_IMGSZ = 640
+YOLO_CONF = 0.25
+YOLO_IOU = 0.45
+
+# YOLO 偵測結果的結構化陣列格式
+DETECTION_DTYPE = np.dtype([
+    ("x1", np.int32), ("y1", np.int32), ("x2", np.int32), ("y2", np.int32),
+    ("conf", np.float32), ("cls", np.int32),
+])
+
+_CONTOUR_MODES = {"external": cv2.RETR_EXTERNAL, "list": cv2.RETR_LIST}
+_CONTOUR_APPROX = {"simple": cv2.CHAIN_APPROX_SIMPLE, "none": cv2.CHAIN_APPROX_NONE}
+_MORPH_OPS = {
+    "dilate": cv2.MORPH_DILATE,
+    "erode": cv2.MORPH_ERODE,
+    "open": cv2.MORPH_OPEN,
+    "close": cv2.MORPH_CLOSE,
+}
+
+
+def contours_to_lists(contours):
+    """把輪廓轉成 [x0, y0, x1, y1, ...] 的扁平整數陣列"""
+    return [c.reshape(-1).tolist() for c in contours]
+
+
+def detections_from_arrays(xyxy, conf=None, cls=None, min_conf=0.0):
+    """由整批 xyxy / conf / cls 陣列建立 DETECTION_DTYPE 結構化陣列"""
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    n = len(xyxy)
+    conf = np.zeros(n, np.float32) if conf is None else np.asarray(conf, np.float32).reshape(-1)
+    cls = np.full(n, -1, np.int32) if cls is None else np.asarray(cls).reshape(-1)
+
+    keep = conf >= min_conf
+    detections = np.empty(int(keep.sum()), DETECTION_DTYPE)
+    coords = xyxy[keep].astype(np.int32)
+    detections["x1"] = coords[:, 0]
+    detections["y1"] = coords[:, 1]
+    detections["x2"] = coords[:, 2]
+    detections["y2"] = coords[:, 3]
+    detections["conf"] = conf[keep]
+    detections["cls"] = cls[keep]
+    return detections
+
+
+def yolo_detections(boxes, min_conf=0.0):
+    """一次取出 ultralytics Boxes 的所有欄位，避免逐框轉換張量"""
+    if boxes is None or len(boxes) == 0:
+        return np.empty(0, DETECTION_DTYPE)
+    conf = boxes.conf.cpu().numpy() if boxes.conf is not None else None
+    cls = boxes.cls.cpu().numpy() if boxes.cls is not None else None
+    return detections_from_arrays(boxes.xyxy.cpu().numpy(), conf, cls, min_conf)
+
+
+def detections_to_lists(detections):
+    """轉成 [x1, y1, x2, y2, conf, cls] 清單供 JSON 回傳"""
+    return [[x1, y1, x2, y2, round(conf, 4), cls]
+            for x1, y1, x2, y2, conf, cls in detections.tolist()]
+
+
+def map_contours(contours, scale, offset):
+    """把輪廓座標換算回原始影像：一次轉換所有點後再切回各輪廓"""
+    if not len(contours):
+        return contours
+    lengths = [len(c) for c in contours]
+    points = np.concatenate(contours).astype(np.float32)
+    points = np.rint(points * scale + np.float32(offset)).astype(np.int32)
+    return tuple(np.split(points, np.cumsum(lengths)[:-1]))
+
+
+def map_detections(detections, scale, offset):
+    mapped = detections.copy()
+    for field, shift in (("x1", offset[0]), ("x2", offset[0]), ("y1", offset[1]),
+                         ("y2", offset[1])):
+        mapped[field] = np.rint(detections[field] * scale + shift)
+    return mapped
+
+
+def map_result(result, scale=1.0, offset=(0, 0)):
+    """回傳座標換算回原始影像的 PipelineResult，沒有縮放與位移時直接回傳原物件"""
+    if scale == 1.0 and tuple(offset) == (0, 0):
+        return result
+    if result.boxes is not None:
+        mapped = PipelineResult(result.count, boxes=map_detections(result.boxes, scale, offset))
+    else:
+        mapped = PipelineResult(result.count,
+                                contours=map_contours(result.contours, scale, offset))
+    mapped.timings = result.timings
+    mapped.reused = result.reused
+    return mapped
+
+
+def bounding_boxes(result):
+    """把 PipelineResult 的偵測框或輪廓外接矩形轉成 (N, 4) xyxy 整數陣列"""
+    if result.boxes is not None:
+        return np.stack([result.boxes["x1"], result.boxes["y1"],
+                         result.boxes["x2"], result.boxes["y2"]], axis=1)
+    if not len(result.contours):
+        return np.empty((0, 4), np.int32)
+    rects = np.array([cv2.boundingRect(c) for c in result.contours], np.int32)
+    rects[:, 2:] += rects[:, :2]
+    return rects
+
+
+def yolo_params(options):
+    """取出並檢查 YOLO 推論參數，未指定的使用預設值"""
+    options = options or {}
+    imgsz = int(options.get("imgsz") or YOLO_IMGSZ)
+    conf = float(options["conf"]) if options.get("conf") is not None else YOLO_CONF
+    iou = float(options["iou"]) if options.get("iou") is not None else YOLO_IOU
+    if not 32 <= imgsz <= 4096:
+        raise ValueError(f"imgsz 必須介於 32 與 4096 之間: {imgsz}")
+    if not (0.0 <= conf <= 1.0 and 0.0 <= iou <= 1.0):
+        raise ValueError("conf 與 iou 必須介於 0 與 1 之間")
+    return {"imgsz": imgsz, "conf": conf, "iou": iou}
+
+
+def draw_count(display_frame, label, count):
+    cv2.putText(display_frame, f"{label} Count: {count}", (20, 50),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3, cv2.LINE_AA)
+
+
+def draw_contours(display_frame, contours, label):
+    cv2.drawContours(display_frame, contours, -1, (0, 255, 0), 2)
+    draw_count(display_frame, label, len(contours))
+
+
+def draw_detections(display_frame, detections, label="YOLO"):
+    for x1, y1, x2, y2, conf, cls_id in detections.tolist():
+        cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(display_frame, f"ID{cls_id} {conf:.2f}", (x1, max(y1-5, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+    draw_count(display_frame, label, len(detections))
+
+
+# 處理階段
+
+
+@register_stage("gray")
+def gray_stage(ctx, image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=ctx.buffer(image.shape[:2]))
+
+
+@register_stage("rgb")
+def rgb_stage(ctx, image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=ctx.buffer(image.shape))
+
+
+@register_stage("blur")
+def blur_stage(ctx, image, ksize=7):
+    return cv2.GaussianBlur(image, (ksize, ksize), 0, dst=ctx.buffer(image.shape, image.dtype))
+
+
+@register_stage("threshold")
+def threshold_stage(ctx, image, thresh=80, otsu=True, invert=True):
+    flags = cv2.THRESH_BINARY_INV if invert else cv2.THRESH_BINARY
+    if otsu:
+        flags += cv2.THRESH_OTSU
+    _, binary = cv2.threshold(image, thresh, 255, flags, dst=ctx.buffer(image.shape, image.dtype))
+    return binary
+
+
+@register_stage("canny")
+def canny_stage(ctx, image, low=100, high=150, aperture=3):
+    return cv2.Canny(image, low, high, edges=ctx.buffer(image.shape), apertureSize=aperture)
+
+
+@register_stage("morphology")
+def morphology_stage(ctx, image, op="dilate", ksize=3, iterations=1):
+    if iterations <= 0:
+        return image
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ksize, ksize))
+    return cv2.morphologyEx(image, _MORPH_OPS[op], kernel, dst=ctx.buffer(image.shape, image.dtype),
+                            iterations=iterations)
+
+
+@register_stage("contours")
+def contours_stage(ctx, binary, mode="external", approx="simple"):
+    # OpenCV 4 的 findContours 不會修改輸入，可直接使用共用的中間結果
+    contours, _ = cv2.findContours(binary, _CONTOUR_MODES[mode], _CONTOUR_APPROX[approx])
+    return contours
+
+
+@register_stage("contour_filter")
+def contour_filter_stage(ctx, contours, min_area=0.0, max_area=None):
+    if not contours:
+        return contours
+    areas = np.fromiter((cv2.contourArea(c) for c in contours), np.float64, len(contours))
+    keep = areas >= min_area
+    if max_area is not None:
+        keep &= areas <= max_area
+    return tuple(c for c, k in zip(contours, keep) if k)
+
+
+class Components:
+    """連通元件標記結果：labels 影像，以及過濾後各元件的標籤、外接矩形與面積"""
+
+    def __init__(self, labels, ids, rects, areas, unit_area):
+        self.labels = labels
+        self.ids = ids
+        # (N, 4) 的 x, y, w, h
+        self.rects = rects
+        self.areas = areas
+        # 單顆藥丸面積的估計值（見 unit_area），沒有元件時為 0
+        self.unit_area = unit_area
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def unit_area(areas, bins_per_octave=4, prominence=0.5):
+    """單顆藥丸面積：對數面積直方圖中面積最小的明顯峰值
+
+    同一批藥丸的單顆面積集中在同一個峰，兩顆、三顆相連的元件落在面積加倍的
+    峰上。取最小、且高度達到最高峰 prominence 倍的峰，相連的元件比單顆多時
+    也不會被誤認為單顆；中位數則會被相連元件或大片背景拉高、被雜點拉低。
+    回傳峰值前後 1.5 組以內元件面積的中位數。
+    """
+    areas = np.asarray(areas, np.float64)
+    if len(areas) < 3:
+        return float(np.median(areas)) if len(areas) else 0.0
+    logs = np.log2(np.maximum(areas, 1.0))
+    low = logs.min()
+    nbins = max(1, int(np.ceil((logs.max() - low) * bins_per_octave)))
+    hist, edges = np.histogram(logs, bins=nbins, range=(low, low + nbins / bins_per_octave))
+    # 相鄰的組平滑一次，避免峰值剛好落在兩組交界時被拆成兩個小峰
+    smooth = np.convolve(np.pad(hist, 1), (1, 2, 1), "valid") / 4.0
+    padded = np.pad(smooth, 1)
+    peaks = (smooth >= padded[:-2]) & (smooth >= padded[2:]) & (smooth >= smooth.max() * prominence)
+    k = int(np.flatnonzero(peaks)[0])
+    center = (edges[k] + edges[k + 1]) / 2
+    return float(np.median(areas[np.abs(logs - center) <= 1.5 / bins_per_octave]))
+
+
+def split_blob(mask, peak_ratio):
+    """以距離轉換找出相連元件中的藥丸核心，回傳核心的外接矩形 (K, 4) x, y, w, h
+
+    距離轉換值達到最大值 peak_ratio 倍以上的區域各自是一顆藥丸的中心；
+    核心往外擴張 peak_ratio 倍的最大距離，約為藥丸的範圍。
+    """
+    dist = cv2.distanceTransform(mask, cv2.DIST_L2, 3)
+    peak = float(dist.max())
+    cores = (dist >= peak * peak_ratio).view(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(cores, connectivity=8)
+    pad = int(round(peak * peak_ratio))
+    x1y1 = np.maximum(stats[1:, :2] - pad, 0)
+    x2y2 = np.minimum(stats[1:, :2] + stats[1:, 2:4] + pad, (mask.shape[1], mask.shape[0]))
+    return np.concatenate([x1y1, x2y2 - x1y1], axis=1)
+
+
+def slice_rect(rect, count):
+    """沿長邊把外接矩形等分成 count 份，距離轉換分不出核心時用來標示各顆的位置"""
+    x, y, w, h = (int(v) for v in rect)
+    edges = np.linspace(0, w if w >= h else h, count + 1).astype(np.int32)
+    if w >= h:
+        return np.array([(x + a, y, b - a, h) for a, b in zip(edges[:-1], edges[1:])], np.int32)
+    return np.array([(x, y + a, w, b - a) for a, b in zip(edges[:-1], edges[1:])], np.int32)
+
+
+def label_components(binary, connectivity=8, labels=None):
+    """connectedComponentsWithStats，標籤數在 65535 以內時使用較快的 16 位元標籤影像
+
+    labels 為重複使用的 uint16 標籤陣列；超過 65535 個標籤時改用新配置的 32 位元陣列。
+    """
+    try:
+        return cv2.connectedComponentsWithStats(binary, labels, connectivity=connectivity,
+                                                ltype=cv2.CV_16U)
+    except cv2.error:
+        return cv2.connectedComponentsWithStats(binary, connectivity=connectivity)
+
+
+@register_stage("components")
+def components_stage(ctx, binary, min_fraction=2e-4, max_fraction=0.2, min_ratio=0.3,
+                     min_fill=0.3, max_aspect=4.0, unit_fill=0.45, connectivity=8,
+                     polarity="auto"):
+    """標記二值影像的連通元件，以 NumPy 一次過濾所有元件
+
+    polarity 為 auto 時，前景像素超過一半就視為反相（背景被標成前景）先反轉。
+    面積以整張影像的比例過濾（不受解析度影響）：小於 min_fraction 的雜點與
+    大於 max_fraction 的背景區塊；填滿外接矩形不到 min_fill 或長寬比超過
+    max_aspect 的細線與邊框；最後去掉小於單顆面積 min_ratio 倍的碎片。
+    單顆面積只由填滿外接矩形 unit_fill 以上的緊實元件估計（見 unit_area）。
+    """
+    if polarity == "auto":
+        invert = cv2.countNonZero(binary) * 2 > binary.size
+    else:
+        invert = polarity == "dark"
+    if invert:
+        binary = cv2.bitwise_not(binary, dst=ctx.buffer(binary.shape))
+    _, labels, stats, _ = label_components(binary, connectivity,
+                                           ctx.buffer(binary.shape, np.uint16))
+    # 標籤 0 是背景
+    stats = stats[1:]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    widths = stats[:, cv2.CC_STAT_WIDTH]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    keep = (areas >= binary.size * min_fraction) & (areas <= binary.size * max_fraction)
+    keep &= areas >= min_fill * widths * heights
+    keep &= np.maximum(widths, heights) <= max_aspect * np.minimum(widths, heights)
+    compact = keep & (areas >= unit_fill * widths * heights)
+    unit = unit_area(areas[compact] if compact.any() else areas[keep])
+    keep &= areas >= unit * min_ratio
+    ids = np.flatnonzero(keep)
+    return Components(labels, ids + 1, stats[ids, :4], areas[keep], unit)
+
+
+@register_stage("blob_split")
+def blob_split_stage(ctx, components, tolerance=0.25, peak_ratio=0.6, max_ratio=8.0):
+    """依單顆面積估計每個元件含幾顆藥丸，回傳每顆一個偵測框（DETECTION_DTYPE）
+
+    面積比 ratio = 元件面積 / 單顆面積。ratio 超過 max_ratio 的元件多半是與
+    藥丸同色的背景、陰影或器具，不計數。ratio 小於 1 + tolerance 的元件直接視為
+    一顆（向量化處理）；較大的元件以距離轉換找核心：ratio 接近整數時以面積估計
+    為準，ratio 落在兩個整數之間（離最近的整數超過 tolerance）時改用核心數，
+    但只接受介於 floor(ratio) 與 ceil(ratio) 之間的核心數。
+    conf 為數量估計的把握程度：單顆為 1，相連元件依 ratio 與估計數量的差距遞減。
+    """
+    n = len(components)
+    if not n:
+        return np.empty(0, DETECTION_DTYPE)
+    ratio = components.areas / max(components.unit_area, 1.0)
+    single = ratio < 1 + tolerance
+    pile = ~single & (ratio <= max_ratio)
+
+    rects = [components.rects[single]]
+    confs = [np.ones(int(single.sum()), np.float32)]
+    for i in np.flatnonzero(pile):
+        x, y, w, h = components.rects[i]
+        mask = (components.labels[y:y + h, x:x + w] == components.ids[i]).view(np.uint8)
+        estimate = max(1, int(np.rint(ratio[i])))
+        cores = split_blob(mask, peak_ratio)
+        count = estimate
+        ambiguous = abs(ratio[i] - estimate) > tolerance
+        if ambiguous and np.floor(ratio[i]) <= len(cores) <= np.ceil(ratio[i]):
+            count = len(cores)
+        if len(cores) == count:
+            blob = cores + (x, y, 0, 0)
+        else:
+            blob = slice_rect(components.rects[i], count)
+        rects.append(blob)
+        confs.append(np.full(count, max(0.0, 1.0 - abs(ratio[i] - count)), np.float32))
+
+    rects = np.concatenate(rects).astype(np.float32)
+    xyxy = np.concatenate([rects[:, :2], rects[:, :2] + rects[:, 2:]], axis=1)
+    return detections_from_arrays(xyxy, np.concatenate(confs), np.zeros(len(xyxy), np.int32))
+
+
+@register_stage("yolo")
+def yolo_stage(ctx, rgb):
+    options = ctx.options
+    params = yolo_params(options)
+    entry = ctx.models.get(options.get("model") or "default")
+    tiles = plan_tiles(rgb.shape, params["imgsz"], **tile_params(options))
+    if tiles is None:
+        r = entry.predict(rgb, **params)
+        return yolo_detections(r.boxes)
+    # 高解析度影像切成重疊的切片一起批次推論，再跨切片合併重複的框
+    results = entry.predict_many([rgb[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles], **params)
+    return merge_tiles([yolo_detections(r.boxes) for r in results], tiles, params["iou"])
+
+
+@register_stage("count")
+def count_stage(ctx, value):
+    if isinstance(value, np.ndarray) and value.dtype == DETECTION_DTYPE:
+        return PipelineResult(len(value), boxes=value)
+    return PipelineResult(len(value), contours=value)
+
+
+@register_stage("annotate")
+def annotate_stage(ctx, result, label=""):
+    if ctx.display_frame is not None:
+        # 算法可能跑在裁切或縮小後的區域上，畫之前先換算回原始座標
+        display = map_result(result, ctx.scale, ctx.offset)
+        if display.boxes is not None:
+            draw_detections(ctx.display_frame, display.boxes, label)
+        else:
+            draw_contours(ctx.display_frame, display.contours, label)
+    return result
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+from executor import QueueFullError
+
+try:
+    from websockets.exceptions import ConnectionClosed
+except ImportError:  # 使用 wsproto 等其他 WebSocket 實作時沒有這個套件
+    ConnectionClosed = WebSocketDisconnect
+
+# 會轉交給處理器的逐請求參數
+OPTION_KEYS = ("model", "imgsz", "conf", "iou", "roi", "max_side", "tiling", "tile_size",
+               "tile_overlap")
+
+
+class DetectionStream:
+    """單一 WebSocket 連線的連續偵測會話
+
+    用戶端以二進位訊息推送 JPEG 影格，以文字訊息（JSON）調整設定，
+    例如 {"algorithm": "yolo11", "annotate": true, "model": "nano", "track": true}，
+    或以 {"roi": [x, y, w, h], "max_side": 640} 設定這條連線的處理區域。
+    伺服器只處理最新的一張影格，處理期間收到的舊影格直接丟棄。
+    每張影格回傳一則 JSON 結果；annotate 開啟時緊接著送出標註後的 JPEG，
+    關閉時依 output（"count" 或 "geometry"）決定結果內容，不繪製也不編碼。
+    """
+
+    def __init__(self, websocket: WebSocket, process, algorithm="algorithm2", annotate=False,
+                 output="count"):
+        self.websocket = websocket
+        # process(image_bytes, algorithm, image_format, output, options) 為處理單張影格的協程
+        self.process = process
+        self.settings = {"algorithm": algorithm, "annotate": annotate, "output": output}
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self._latest = None
+        self._frame_ready = asyncio.Event()
+
+    async def run(self):
+        receiver = asyncio.ensure_future(self._receive_loop())
+        worker = asyncio.ensure_future(self._process_loop())
+        try:
+            done, _ = await asyncio.wait(
+                {receiver, worker}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    if not self._is_disconnect(task.exception()):
+                        raise task.exception()
+        finally:
+            receiver.cancel()
+            worker.cancel()
+            # 等另一個工作真正結束，它在取消前拋出的例外也一併收走
+            await asyncio.gather(receiver, worker, return_exceptions=True)
+
+    def _is_disconnect(self, error):
+        """用戶端關閉後才送出的訊息會失敗，視同斷線而不是處理錯誤"""
+        if isinstance(error, (WebSocketDisconnect, ConnectionClosed)):
+            return True
+        closed = (self.websocket.client_state == WebSocketState.DISCONNECTED
+                  or self.websocket.application_state == WebSocketState.DISCONNECTED)
+        return closed and isinstance(error, (RuntimeError, OSError))
+
+    async def _receive_loop(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                self.received += 1
+                if self._latest is not None:
+                    # 上一張還沒開始處理就被新影格取代
+                    self.dropped += 1
+                self._latest = message["bytes"]
+                self._frame_ready.set()
+            elif message.get("text") is not None:
+                await self._update_settings(message["text"])
+
+    async def _update_settings(self, text):
+        try:
+            changes = json.loads(text)
+            if not isinstance(changes, dict):
+                raise ValueError("設定必須是 JSON 物件")
+        except ValueError as e:
+            await self.websocket.send_json({"type": "error", "error": f"無效的設定: {e}"})
+            return
+        for key in ("algorithm", "annotate", "output", "track") + OPTION_KEYS:
+            if key in changes:
+                self.settings[key] = changes[key]
+        await self.websocket.send_json({"type": "settings", **self.settings})
+
+    async def _process_loop(self):
+        while True:
+            await self._frame_ready.wait()
+            self._frame_ready.clear()
+            image_bytes, self._latest = self._latest, None
+            if image_bytes is None:
+                continue
+
+            algorithm = self.settings["algorithm"]
+            annotate = bool(self.settings["annotate"])
+            output = "image" if annotate else self.settings["output"]
+            options = {k: self.settings[k] for k in OPTION_KEYS
+                       if self.settings.get(k) is not None}
+            if self.settings.get("track"):
+                options["track"] = True
+            try:
+                result = await self.process(image_bytes, algorithm, "jpeg", output, options)
+            except QueueFullError as e:
+                await self.websocket.send_json({"type": "busy", "error": str(e)})
+                continue
+            except asyncio.TimeoutError:
+                await self.websocket.send_json({"type": "error", "error": "影像處理逾時"})
+                continue
+
+            self.processed += 1
+            processed_jpeg = result.pop("processed_jpeg", None)
+            await self.websocket.send_json({
+                "type": "result",
+                "frame": self.processed,
+                "dropped": self.dropped,
+                **result,
+            })
+            if annotate and processed_jpeg is not None:
+                await self.websocket.send_bytes(processed_jpeg)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 後端模組以扁平方式互相匯入（import config），測試時從 pillo_backend 目錄載入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+import cv2
+import numpy as np
+
+from processor import ImageProcessor
+from stages import unit_area
+
+RADIUS = 22
+
+
+def touching_discs(groups):
+    """淺色背景上的深色圓形藥丸，groups 為各組相連的顆數，每組放在各自的格子裡"""
+    image = np.full((720, 960, 3), 200, np.uint8)
+    for k, size in enumerate(groups):
+        cx, cy = 90 + (k % 5) * 190, 90 + (k // 5) * 180
+        for i in range(size):
+            # 同一組的圓心相距 1.8 倍半徑，彼此重疊相連
+            center = (cx + int(i * 1.8 * RADIUS * 0.5), cy + int(i * 1.8 * RADIUS * 0.8))
+            cv2.circle(image, center, RADIUS, (60, 50, 70), -1)
+    # 小於藥丸面積門檻的雜點
+    for x, y in [(30, 30), (500, 700), (940, 400), (700, 20)]:
+        cv2.circle(image, (x, y), 2, (60, 50, 70), -1)
+    return image
+
+
+def test_unit_area_ignores_merged_majority():
+    # 相連的兩顆比單顆多時，中位數落在兩顆的面積上
+    areas = np.array([1500, 1520, 1480, 1510, 3000, 2980, 3050, 3010, 2990, 3020, 4500, 4550])
+    assert abs(unit_area(areas) - 1505) < 30
+
+
+def test_algorithm3_counts_touching_discs():
+    groups = [1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 3, 3, 3]
+    result = ImageProcessor(buffer_pool_mb=0).process_array(
+        touching_discs(groups), "algorithm3", "jpeg", "count")
+    assert result["success"]
+    assert result["count"] == sum(groups)
@@ -0,0 +1,27 @@
+import numpy as np
+
+import algorithms  # noqa: F401  註冊內建算法
+from pipeline import FrameContext, Pipeline
+
+STAGES = [("gray", {}), ("blur", {"ksize": 5}),
+          ("threshold", {"thresh": 80, "otsu": True, "invert": True}),
+          ("contours", {"mode": "external", "approx": "simple"}), ("count", {})]
+
+
+def test_pipelines_sharing_count_keep_their_own_timings():
+    # 只差在標註文字的兩個算法，count 之前的階段全部共用
+    first = Pipeline("first", STAGES + [("annotate", {"label": "A"})])
+    second = Pipeline("second", STAGES + [("annotate", {"label": "B"})])
+    frame = np.full((120, 160, 3), 200, np.uint8)
+    frame[40:80, 50:90] = 40
+    ctx = FrameContext(frame)
+
+    a = first.run(ctx)
+    timings = dict(a.timings)
+    b = second.run(ctx)
+
+    assert a is not b
+    assert a.count == b.count == 1
+    assert a.timings == timings and a.reused == []
+    assert b.reused == ["gray", "blur", "threshold", "contours", "count"]
+    assert list(b.timings) == ["annotate"]
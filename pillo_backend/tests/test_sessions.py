@@ -0,0 +1,21 @@
+import numpy as np
+
+from sessions import MotionGate, Session
+
+THUMB = np.zeros((48, 64), np.uint8)
+
+
+def test_reused_result_drops_cache_flag():
+    session = Session("s", MotionGate())
+    key = ("algorithm1", "jpeg", "count", "{}")
+    session.update(THUMB, key, {"success": True, "count": 3, "cached": True})
+    reused, _ = session.reuse(THUMB, key)
+    assert reused["stale"] is True
+    assert "cached" not in reused
+
+
+def test_tracker_resets_when_algorithm_changes():
+    session = Session("s", MotionGate(), tracker_factory=object)
+    tracker = session.get_tracker(("algorithm1", "{}"))
+    assert session.get_tracker(("algorithm1", "{}")) is tracker
+    assert session.get_tracker(("yolo11", "{}")) is not tracker
@@ -0,0 +1,35 @@
+import asyncio
+
+from starlette.websockets import WebSocketState
+
+from streaming import DetectionStream
+
+
+class ClosingWebSocket:
+    """送出一張影格後就關閉的用戶端，之後的 send 都會失敗"""
+
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.application_state = WebSocketState.CONNECTED
+        self._messages = [{"type": "websocket.receive", "bytes": b"frame"}]
+
+    async def receive(self):
+        if self._messages:
+            return self._messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send_json(self, data):
+        self.client_state = WebSocketState.DISCONNECTED
+        raise RuntimeError('Cannot call "send" once a close message has been sent.')
+
+
+def test_send_after_close_ends_stream_cleanly():
+    async def process(*args):
+        return {"success": True, "count": 1}
+
+    async def main():
+        stream = DetectionStream(ClosingWebSocket(), process)
+        await asyncio.wait_for(stream.run(), 5)
+        return stream
+
+    assert asyncio.run(main()).processed == 1
@@ -0,0 +1,34 @@
+import numpy as np
+
+from stages import DETECTION_DTYPE
+from tiling import merge_tiles
+
+TILES = [(0, 0, 640, 640), (512, 0, 1152, 640)]
+
+
+def boxes(*rows):
+    """(x1, y1, x2, y2, conf) 組成的偵測結果，類別都是 0"""
+    detections = np.zeros(len(rows), DETECTION_DTYPE)
+    for detection, (x1, y1, x2, y2, conf) in zip(detections, rows):
+        detection["x1"], detection["y1"], detection["x2"], detection["y2"] = x1, y1, x2, y2
+        detection["conf"] = conf
+    return detections
+
+
+def test_adjacent_pills_in_one_tile_survive():
+    # 同一切片內互相接觸的兩顆膠囊（IoU 約 0.33）與被大框包住的小藥丸
+    first = boxes((100, 100, 200, 180, 0.9), (150, 100, 250, 180, 0.8),
+                  (300, 300, 400, 400, 0.9), (320, 320, 350, 350, 0.7))
+    merged = merge_tiles([first, boxes()], TILES, 0.45)
+    assert len(merged) == 4
+    assert merged["x2"].max() == 400
+    assert sorted(merged["x2"][merged["y1"] == 100]) == [200, 250]
+
+
+def test_truncated_box_across_seam_is_merged():
+    # 同一顆藥丸在左切片完整、在右切片被邊緣截斷（座標為切片內座標）
+    left = boxes((560, 200, 620, 260, 0.9))
+    right = boxes((48, 200, 100, 262, 0.6))
+    merged = merge_tiles([left, right], TILES, 0.45)
+    assert len(merged) == 1
+    assert (merged["x1"][0], merged["x2"][0], merged["y2"][0]) == (560, 620, 262)
@@ -0,0 +1,136 @@
+import numpy as np
+
+import config
+
+TILING_MODES = ("auto", "on", "off")
+
+
+def tile_params(options):
+    """取出並檢查切片參數，未指定的使用設定檔預設值"""
+    options = options or {}
+    mode = options.get("tiling") or config.TILE_MODE
+    size = int(options.get("tile_size") or config.TILE_SIZE)
+    overlap = options.get("tile_overlap")
+    overlap = float(overlap) if overlap is not None else config.TILE_OVERLAP
+    if mode not in TILING_MODES:
+        raise ValueError(f"tiling 必須是 {'、'.join(TILING_MODES)} 之一: {mode}")
+    if not 128 <= size <= 8192:
+        raise ValueError(f"tile_size 必須介於 128 與 8192 之間: {size}")
+    if not 0.0 <= overlap < 0.9:
+        raise ValueError(f"tile_overlap 必須介於 0 與 0.9 之間: {overlap}")
+    return {"mode": mode, "size": size, "overlap": overlap}
+
+
+def _starts(length, size, step):
+    if length <= size:
+        return [0]
+    starts = list(range(0, length - size, step))
+    # 最後一塊貼齊影像邊緣，不留下沒涵蓋的區域
+    starts.append(length - size)
+    return starts
+
+
+def tile_grid(width, height, size, overlap):
+    """回傳涵蓋整張影像、彼此重疊 overlap 比例的切片 [(x0, y0, x1, y1), ...]"""
+    step = max(1, int(size * (1.0 - overlap)))
+    return [(x, y, min(x + size, width), min(y + size, height))
+            for y in _starts(height, size, step)
+            for x in _starts(width, size, step)]
+
+
+def plan_tiles(shape, imgsz, mode="auto", size=1280, overlap=0.2):
+    """決定是否切片；不切片時回傳 None
+
+    auto 模式下，只有整張縮到 imgsz 時物件會被縮小 TILE_AUTO_SCALE 倍以上，
+    而且切片後確實不只一塊，才值得多花數倍推論時間切片。
+    """
+    height, width = shape[:2]
+    if mode == "off":
+        return None
+    if mode == "auto" and max(width, height) / imgsz < config.TILE_AUTO_SCALE:
+        return None
+    tiles = tile_grid(width, height, size, overlap)
+    return tiles if len(tiles) > 1 else None
+
+
+def nms(detections, iou_threshold, tile_ids=None, seam=None):
+    """依類別做非極大值抑制，回傳 [(保留的索引, 要併入它的索引陣列), ...]
+
+    一般情況只以 IoU 判斷重疊。提供 tile_ids 與 seam 時，來自不同切片、
+    且至少一個框碰到切片接縫或重疊區的兩個框，另以「交集 / 較小框面積」
+    判斷：物件被切片邊緣截斷時，殘缺的框與完整的框 IoU 不高，但幾乎完全
+    被完整的框包住，仍應被抑制並併入完整的框。同一切片內的框已經由 YOLO
+    自己的 NMS 處理過，互相接觸或大小相差很多的藥丸都不會被合併。
+    """
+    if len(detections) == 0:
+        return []
+    x1 = detections["x1"].astype(np.float32)
+    y1 = detections["y1"].astype(np.float32)
+    x2 = detections["x2"].astype(np.float32)
+    y2 = detections["y2"].astype(np.float32)
+    cls = detections["cls"]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-detections["conf"], kind="stable")
+    keep = []
+    while len(order):
+        i = order[0]
+        rest = order[1:]
+        w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = w * h
+        same = cls[rest] == cls[i]
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        if tile_ids is None:
+            merged = np.zeros(len(rest), bool)
+        else:
+            ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+            across = (tile_ids[rest] != tile_ids[i]) & (seam[i] | seam[rest])
+            merged = same & across & (np.maximum(iou, ios) > iou_threshold)
+        suppressed = merged | (same & (iou > iou_threshold))
+        keep.append((i, rest[merged]))
+        order = rest[~suppressed]
+    return keep
+
+
+def seam_mask(detections, tile_ids, tiles):
+    """每個框是否碰到所屬切片以外的切片，也就是落在接縫或重疊區內"""
+    seam = np.zeros(len(detections), bool)
+    for t, (x0, y0, x1, y1) in enumerate(tiles):
+        touches = ((detections["x1"] < x1) & (detections["x2"] > x0)
+                   & (detections["y1"] < y1) & (detections["y2"] > y0))
+        seam |= touches & (tile_ids != t)
+    return seam
+
+
+def merge_tiles(tile_detections, tiles, iou_threshold):
+    """把各切片的偵測結果平移回整張影像座標並跨切片做 NMS
+
+    跨切片、位於接縫附近的重複框會併入信心值較高的框，保留的框擴張成
+    涵蓋它們，因此被切片邊緣截斷的物件合併後仍是完整的範圍。
+    """
+    shifted = []
+    tile_ids = []
+    for t, (detections, (x0, y0, _, _)) in enumerate(zip(tile_detections, tiles)):
+        if len(detections) == 0:
+            continue
+        detections = detections.copy()
+        detections["x1"] += x0
+        detections["x2"] += x0
+        detections["y1"] += y0
+        detections["y2"] += y0
+        shifted.append(detections)
+        tile_ids.append(np.full(len(detections), t))
+    if not shifted:
+        return tile_detections[0][:0]
+    detections = np.concatenate(shifted)
+    tile_ids = np.concatenate(tile_ids)
+    groups = nms(detections, iou_threshold, tile_ids, seam_mask(detections, tile_ids, tiles))
+    merged = detections[[i for i, _ in groups]]
+    for k, (i, members) in enumerate(groups):
+        if len(members):
+            members = detections[np.append(members, i)]
+            merged[k]["x1"] = members["x1"].min()
+            merged[k]["y1"] = members["y1"].min()
+            merged[k]["x2"] = members["x2"].max()
+            merged[k]["y2"] = members["y2"].max()
+    return merged
@@ -0,0 +1,194 @@
+import threading
+
+import numpy as np
+
+# 兩兩比較時每次處理的軌跡數，避免上千個 Canny 輪廓時建立過大的矩陣
+BLOCK_SIZE = 256
+# 計數穩定時建議的輪詢間隔上下限（毫秒）
+MIN_POLL_INTERVAL_MS = 200
+MAX_POLL_INTERVAL_MS = 2000
+
+
+def iou_matrix(a, b):
+    """計算兩組 xyxy 框兩兩之間的 IoU，回傳 (len(a), len(b)) 陣列"""
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def centroid_distance(a, b):
+    """兩組框中心點的距離，以 a 各框的對角線長度正規化"""
+    ca = (a[:, :2] + a[:, 2:]) / 2.0
+    cb = (b[:, :2] + b[:, 2:]) / 2.0
+    diag = np.hypot(a[:, 2] - a[:, 0], a[:, 3] - a[:, 1]).astype(np.float32)
+    dist = np.hypot(ca[:, None, 0] - cb[None, :, 0], ca[:, None, 1] - cb[None, :, 1])
+    return dist / np.maximum(diag, 1.0)[:, None]
+
+
+def candidate_pairs(metric, a, b, accept):
+    """分塊計算 metric(a, b)，只保留 accept 為真的 (列, 行, 分數)"""
+    rows, cols, values = [], [], []
+    for start in range(0, len(a), BLOCK_SIZE):
+        score = metric(a[start:start + BLOCK_SIZE], b)
+        r, c = np.nonzero(accept(score))
+        rows.append(r + start)
+        cols.append(c)
+        values.append(score[r, c])
+    if not rows:
+        return np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+
+def greedy_match(rows, cols, values, descending=True):
+    """依分數由好到差貪婪配對，回傳 (列索引, 行索引) 清單，每列每行最多配對一次"""
+    if len(rows) == 0:
+        return []
+    order = np.argsort(-values if descending else values, kind="stable")
+    used_rows, used_cols, pairs = set(), set(), []
+    for i in order:
+        r, c = int(rows[i]), int(cols[i])
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+class CountTracker:
+    """跨影格追蹤偵測框，輸出平滑後的穩定數量與各物件 ID
+
+    每張影格先以 IoU 配對既有軌跡，剩下的再以中心點距離配對；
+    連續出現 min_hits 次的軌跡才列入計數，連續消失超過 max_misses
+    次才移除，因此邊緣的 Canny 碎片或信心值在門檻附近的 YOLO 框
+    不會讓數量來回跳動。回報的 stable_count 另外加上遲滯：新的數量
+    必須連續維持 hysteresis 張影格才會取代舊值。
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=0.5, min_hits=2, max_misses=3,
+                 hysteresis=3, stable_frames=5):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.hysteresis = hysteresis
+        self.stable_frames = stable_frames
+        self.frames = 0
+        self.stable_count = None
+        self._next_id = 1
+        self._ids = np.empty(0, np.int64)
+        self._boxes = np.empty((0, 4), np.int32)
+        self._hits = np.empty(0, np.int32)
+        self._misses = np.empty(0, np.int32)
+        self._pending = None
+        self._pending_frames = 0
+        self._unchanged_frames = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stable(self):
+        return self.stable_count is not None and self._unchanged_frames >= self.stable_frames
+
+    def update(self, boxes):
+        """以這張影格的 (N, 4) xyxy 框更新軌跡，回傳追蹤摘要"""
+        boxes = np.asarray(boxes, np.int32).reshape(-1, 4)
+        with self._lock:
+            self.frames += 1
+            matched = self._associate(boxes)
+            tracked = int(np.count_nonzero(self._hits >= self.min_hits))
+            self._update_stable_count(tracked)
+            return {
+                # 軌跡還沒累積到 min_hits 之前，先以原始數量暫代
+                "stable_count": self.stable_count if self.stable_count is not None
+                else len(boxes),
+                "tracked_count": tracked,
+                "raw_count": len(boxes),
+                "matched": matched,
+                "stable": self.stable,
+                "suggested_interval_ms": self.suggested_interval_ms(),
+            }
+
+    def objects(self):
+        """目前已確認的物件：[{"id", "box"}]"""
+        with self._lock:
+            confirmed = self._hits >= self.min_hits
+            return [{"id": int(i), "box": box}
+                    for i, box in zip(self._ids[confirmed].tolist(),
+                                      self._boxes[confirmed].tolist())]
+
+    def suggested_interval_ms(self):
+        """數量穩定越久，建議用戶端輪詢得越慢"""
+        if not self.stable:
+            return MIN_POLL_INTERVAL_MS
+        extra = self._unchanged_frames - self.stable_frames
+        return min(MAX_POLL_INTERVAL_MS, MIN_POLL_INTERVAL_MS * 2 ** min(extra // 5 + 1, 4))
+
+    def _associate(self, boxes):
+        n_tracks = len(self._boxes)
+        track_matched = np.zeros(n_tracks, bool)
+        box_matched = np.zeros(len(boxes), bool)
+        pairs = []
+        if n_tracks and len(boxes):
+            pairs = greedy_match(*candidate_pairs(
+                iou_matrix, self._boxes, boxes, lambda iou: iou >= self.iou_threshold))
+            for r, c in pairs:
+                track_matched[r] = box_matched[c] = True
+
+            # IoU 配對不到的（例如框大小變化較大）改用中心點距離
+            rest_t = np.flatnonzero(~track_matched)
+            rest_b = np.flatnonzero(~box_matched)
+            if len(rest_t) and len(rest_b):
+                candidates = candidate_pairs(centroid_distance, self._boxes[rest_t],
+                                             boxes[rest_b], lambda d: d <= self.max_distance)
+                for r, c in greedy_match(*candidates, descending=False):
+                    pairs.append((int(rest_t[r]), int(rest_b[c])))
+                    track_matched[rest_t[r]] = box_matched[rest_b[c]] = True
+
+        if pairs:
+            t_idx = np.array([p[0] for p in pairs])
+            b_idx = np.array([p[1] for p in pairs])
+            self._boxes[t_idx] = boxes[b_idx]
+            self._hits[t_idx] += 1
+            self._misses[t_idx] = 0
+        self._misses[~track_matched] += 1
+
+        keep = self._misses <= self.max_misses
+        new = np.flatnonzero(~box_matched)
+        new_ids = np.arange(self._next_id, self._next_id + len(new), dtype=np.int64)
+        self._next_id += len(new)
+        self._ids = np.concatenate([self._ids[keep], new_ids])
+        self._boxes = np.concatenate([self._boxes[keep], boxes[new]])
+        self._hits = np.concatenate([self._hits[keep], np.ones(len(new), np.int32)])
+        self._misses = np.concatenate([self._misses[keep], np.zeros(len(new), np.int32)])
+        return len(pairs)
+
+    def _update_stable_count(self, tracked):
+        if self.stable_count is None:
+            if self.frames < self.min_hits:
+                return
+            self.stable_count = tracked
+            self._unchanged_frames = 1
+            return
+        if tracked == self.stable_count:
+            self._pending = None
+            self._pending_frames = 0
+            self._unchanged_frames += 1
+            return
+        if tracked == self._pending:
+            self._pending_frames += 1
+        else:
+            self._pending = tracked
+            self._pending_frames = 1
+        if self._pending_frames >= self.hysteresis:
+            self.stable_count = tracked
+            self._pending = None
+            self._pending_frames = 0
+            self._unchanged_frames = 1
@@ -0,0 +1,195 @@
+"""傳統算法（Otsu / Canny）的參數自動調整
+
+    python tune.py -o presets.json
+    python tune.py --family canny --samples 300 --workers 4 -o presets.json
+
+在標註資料集上以網格搜尋（或 --samples 隨機抽樣網格）模糊核大小、二值化 /
+Canny 門檻、形態學運算與輪廓面積上下限，以數量平均誤差（MAE）為主、
+偵測框 F1 為輔排序。候選參數依共同前綴分組後分給行程池，同一組在
+同一張影格上共用灰階、模糊等中間結果（FrameContext）。
+
+每個算法族群最好的參數寫成具名的預設（例如 otsu_tuned、canny_tuned），
+後端以 PILLO_PRESETS=presets.json 啟動時會註冊成可選用的算法。
+注意面積門檻以像素計，只適用於與資料集解析度相近的影像。
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import algorithms  # noqa: F401  註冊內建算法與處理階段
+from labels import DEFAULT_DATASET, load_dataset, match_boxes, precision_recall, to_pixels
+from pipeline import FrameContext, Pipeline
+from stages import bounding_boxes
+
+# 各算法族群的搜尋空間：前處理、偵測與面積過濾分開列出，組合後成為完整管線
+SEARCH_SPACE = {
+    "otsu": {
+        "label": "Otsu",
+        "base": "algorithm1",
+        "blur": [3, 5, 7, 9],
+        "detect": [("threshold", {"thresh": 80, "otsu": True, "invert": invert})
+                   for invert in (True, False)],
+        "morphology": [None] + [{"op": op, "ksize": k, "iterations": it}
+                                for op in ("open", "close") for k in (3, 5) for it in (1, 2)],
+        "contours": {"mode": "external", "approx": "simple"},
+    },
+    "canny": {
+        "label": "Canny",
+        "base": "algorithm2",
+        "blur": [3, 5, 7, 9],
+        "detect": [("canny", {"low": low, "high": high, "aperture": 3})
+                   for low in (30, 50, 75, 100) for high in (100, 150, 200, 250) if high > low],
+        "morphology": [None] + [{"op": "close", "ksize": k, "iterations": it}
+                                for k in (3, 5) for it in (1, 2, 3)],
+        "contours": {"mode": "external", "approx": "simple"},
+    },
+}
+MIN_AREAS = [0, 50, 200, 500, 1000, 2000]
+MAX_AREAS = [None, 20000, 50000]
+
+# 工作者行程各自快取的資料集影像
+_images = None
+
+
+def candidates(family):
+    """依序列出某族群所有參數組合的 stages 清單，前綴相同的組合彼此相鄰"""
+    space = SEARCH_SPACE[family]
+    for ksize, (stage, params), morph in itertools.product(
+            space["blur"], space["detect"], space["morphology"]):
+        prefix = [("gray", {}), ("blur", {"ksize": ksize}), (stage, params)]
+        if morph is not None:
+            prefix.append(("morphology", morph))
+        prefix.append(("contours", space["contours"]))
+        for min_area, max_area in itertools.product(MIN_AREAS, MAX_AREAS):
+            if max_area is not None and max_area <= min_area:
+                continue
+            stages = list(prefix)
+            if min_area or max_area is not None:
+                stages.append(("contour_filter", {"min_area": min_area, "max_area": max_area}))
+            stages.append(("count", {}))
+            yield stages
+
+
+def _load_images(dataset):
+    global _images
+    if _images is None:
+        _images = []
+        for root in dataset:
+            for path, truth in load_dataset(root):
+                if truth is None:
+                    continue
+                frame = cv2.imread(path)
+                height, width = frame.shape[:2]
+                _images.append((frame, to_pixels(truth, width, height)))
+    return _images
+
+
+def evaluate_chunk(chunk, dataset, iou_threshold):
+    """在每張影像上執行一組候選管線，回傳各自的 (MAE, 平均誤差, precision, recall, F1)"""
+    cv2.setNumThreads(1)
+    images = _load_images(dataset)
+    pipelines = [Pipeline("candidate", stages) for stages in chunk]
+    errors = np.zeros((len(chunk), len(images)))
+    matches = np.zeros((len(chunk), 3), np.int64)
+    for j, (frame, truth) in enumerate(images):
+        ctx = FrameContext(frame)
+        for i, pipeline in enumerate(pipelines):
+            result = pipeline.run(ctx)
+            errors[i, j] = result.count - len(truth)
+            matches[i] += match_boxes(bounding_boxes(result), truth, iou_threshold)
+    scores = []
+    for i in range(len(chunk)):
+        precision, recall, f1 = precision_recall(*matches[i])
+        scores.append({
+            "mae": round(float(np.abs(errors[i]).mean()), 3),
+            "mean_error": round(float(errors[i].mean()), 3),
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": round(f1, 4),
+        })
+    return scores
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def tune(family, dataset, samples=None, workers=None, iou_threshold=0.5, seed=0):
+    """搜尋一個族群的參數，回傳依分數排序的 [(分數, stages)]"""
+    grid = list(candidates(family))
+    if samples and samples < len(grid):
+        # 隨機抽樣後仍依原順序排列，讓前綴相同的組合留在同一塊
+        keep = sorted(random.Random(seed).sample(range(len(grid)), samples))
+        grid = [grid[i] for i in keep]
+
+    workers = workers or os.cpu_count() or 1
+    # 每塊約含一種前處理的所有面積組合，兼顧共用中間結果與平行度
+    size = max(1, min(len(grid) // (workers * 4) or 1, 64))
+    chunks = list(_chunks(grid, size))
+    if workers == 1:
+        results = [evaluate_chunk(chunk, dataset, iou_threshold) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(evaluate_chunk, chunks, [dataset] * len(chunks),
+                                    [iou_threshold] * len(chunks)))
+    scored = [(score, stages) for chunk_scores, chunk in zip(results, chunks)
+              for score, stages in zip(chunk_scores, chunk)]
+    scored.sort(key=lambda item: (item[0]["mae"], -item[0]["f1"]))
+    return scored
+
+
+def preset(family, score, stages):
+    label = SEARCH_SPACE[family]["label"]
+    return {
+        "description": f"{label} 自動調整參數（MAE {score['mae']}，F1 {score['f1']}）",
+        "base": SEARCH_SPACE[family]["base"],
+        "stages": [[stage, params] for stage, params in stages] + [["annotate", {"label": label}]],
+        "metrics": score,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", nargs="+", default=[DEFAULT_DATASET])
+    parser.add_argument("--family", nargs="+", choices=list(SEARCH_SPACE),
+                        default=list(SEARCH_SPACE))
+    parser.add_argument("--samples", type=int, help="每個族群隨機抽樣的組合數，預設跑完整網格")
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--top", type=int, default=5, help="每個族群列出前幾名")
+    parser.add_argument("-o", "--output", default="presets.json")
+    args = parser.parse_args()
+
+    if not any(truth is not None for root in args.dataset for _, truth in load_dataset(root)):
+        parser.error(f"資料集中沒有標註: {', '.join(args.dataset)}")
+
+    presets = {}
+    if os.path.exists(args.output):
+        with open(args.output, encoding="utf-8") as f:
+            presets = json.load(f).get("presets", {})
+    for family in args.family:
+        start = time.perf_counter()
+        scored = tune(family, args.dataset, args.samples, args.workers, args.iou)
+        print(f"🎛️ {family}: {len(scored)} 組參數，{time.perf_counter() - start:.1f}s")
+        for rank, (score, stages) in enumerate(scored[:args.top], 1):
+            params = ", ".join(f"{s}{p}" for s, p in stages if p)
+            print(f"  {rank}. MAE {score['mae']:.2f}  F1 {score['f1']:.3f}  {params}")
+        score, stages = scored[0]
+        presets[f"{family}_tuned"] = preset(family, score, stages)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"presets": presets}, f, ensure_ascii=False, indent=2)
+    print(f"✅ 已寫入 {len(presets)} 個預設 → {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,9 +10,9 @@ def get_local_ip():
         return "127.0.0.1"
 
 # 或者獲取所有網路介面
-import netifaces
-
 def get_all_ips():
+    # netifaces 只有這裡用到，呼叫時才匯入，不拖慢服務啟動
+    import netifaces
     ips = []
     for interface in netifaces.interfaces():
         try:
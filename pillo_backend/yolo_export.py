@@ -0,0 +1,39 @@
+import os
+
+# 各推論後端匯出後的檔案位置（ultralytics 預設會放在權重檔旁邊）
+EXPORT_SUFFIXES = {
+    "onnx": ".onnx",
+    "openvino": "_openvino_model",
+}
+BACKENDS = ("torch",) + tuple(EXPORT_SUFFIXES)
+
+
+def exported_path(weights, backend):
+    stem, _ = os.path.splitext(weights)
+    return stem + EXPORT_SUFFIXES[backend]
+
+
+def resolve_weights(weights, backend="torch", imgsz=640):
+    """回傳指定後端要載入的模型路徑
+
+    torch 直接使用 .pt；onnx / openvino 第一次使用時匯出並留在磁碟上，
+    之後只要匯出檔比 .pt 新就直接沿用，不再重新匯出。
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不支援的 YOLO 推論後端: {backend}")
+    if backend == "torch":
+        return weights
+
+    target = exported_path(weights, backend)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights):
+        return target
+
+    from ultralytics import YOLO
+    print(f"📦 匯出 {weights} 為 {backend} 格式...")
+    # dynamic=True 讓匯出的模型接受任意批次大小，動態批次才能使用
+    path = YOLO(weights).export(format=backend, imgsz=imgsz, dynamic=True)
+    path = str(path)
+    if os.path.normpath(path) != os.path.normpath(target):
+        os.replace(path, target)
+    print(f"✅ 匯出完成: {target}")
+    return target